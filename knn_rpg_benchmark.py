@@ -0,0 +1,280 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from knn_rpg_core import RPGInventory, ShardedBruteForceBackend
+
+# Headless scaling benchmark for the recommender pipeline. Each (players, items) configuration
+# runs in a fresh spawned process, and every stage records its own peak RSS along with the
+# resident set size before and after it. Every stage is written as one JSON line to the output
+# file for comparison across versions.
+#
+#   python knn_rpg_benchmark.py --output bench.jsonl
+#   python knn_rpg_benchmark.py --players 1000 100000 --items 8 10000 --grid
+#   python knn_rpg_benchmark.py --players 1000000 10000000 --items 8 --compact
+
+PLAYER_SWEEP = [100, 1000, 10000, 100000, 1000000]
+ITEM_SWEEP = [8, 100, 1000, 10000, 100000]
+
+def peak_rss_mb():
+    # Highest RSS of the process so far, not of any one stage (on Linux, since the last
+    # high-water mark reset); ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+def current_rss_mb():
+    # Resident set size right now, from /proc or else psutil; None when neither is available
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def reset_high_water_mark():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def high_water_mark_mb():
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+class StagePeak:
+    # Highest RSS while the block runs. On Linux the kernel's high-water mark is reset before the
+    # block and read after it; elsewhere a background thread samples RSS every interval seconds,
+    # which can miss spikes shorter than that
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self.thread = None
+
+    def __enter__(self):
+        if reset_high_water_mark():
+            return self
+        self.peak = current_rss_mb()
+        if self.peak is not None:
+            self.stopped = threading.Event()
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc_info):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+        elif self.peak is None:
+            self.peak = high_water_mark_mb()
+        return False
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StageTimer:
+    def __init__(self, config):
+        self.config = config
+        self.results = []
+        # Stages reset the kernel's high-water mark, so the running peak is kept here
+        self.peak_so_far = peak_rss_mb()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows):
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        # Library code reports progress with print(); keep the benchmark output clean
+        with StagePeak() as peak, contextlib.redirect_stdout(io.StringIO()):
+            yield
+        wall_seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+        if peak.peak is not None:
+            self.peak_so_far = max(self.peak_so_far, peak.peak)
+        self.results.append({
+            **self.config,
+            'stage': name,
+            'rows': rows,
+            'wall_seconds': wall_seconds,
+            'rows_per_second': rows / wall_seconds if wall_seconds > 0 else None,
+            'rss_before_mb': rss_before,
+            'rss_after_mb': rss_after,
+            'rss_delta_mb': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            'peak_rss_mb': peak.peak,
+            'cumulative_peak_rss_mb': self.peak_so_far,
+        })
+
+def run_configuration(n_players, n_items, n_queries, batch_size, json_max_players, workers, compact, seed, queue):
+    # Always answer the parent, otherwise it would wait on the queue forever
+    try:
+        queue.put(benchmark_configuration(
+            n_players, n_items, n_queries, batch_size, json_max_players, workers, compact, seed
+        ))
+    except Exception as error:
+        queue.put({'error': repr(error)})
+        raise
+
+def benchmark_configuration(n_players, n_items, n_queries, batch_size, json_max_players, workers, compact, seed):
+    # knn_rpg_core imports these lazily; load them up front so the first stage isn't billed for it
+    import pandas
+    import sklearn.neighbors
+    import sklearn.preprocessing
+
+    timer = StageTimer({'n_players': n_players, 'n_items': n_items, 'compact': compact, 'seed': seed})
+    game = RPGInventory(seed=seed, compact=compact)
+    if n_items > len(game.item_catalog):
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.generate_simulated_items(n_items - len(game.item_catalog))
+    recommender = game.recommender
+
+    with timer.stage('generate_simulated_players', n_players):
+        game.generate_simulated_players(n_players)
+    with timer.stage('fit', n_players):
+        recommender.fit()
+    # Accounted (not resident) memory of what the recommender holds right after fitting
+    memory = recommender.memory_report()
+    timer.results[-1].update({
+        'index_mb': memory['index'] / (1024 * 1024),
+        'recommender_mb': memory['total'] / (1024 * 1024),
+        'recommender_mb_per_million': memory['bytes_per_million_characters'] / (1024 * 1024),
+    })
+
+    rng = np.random.default_rng(seed)
+    query_rows = rng.integers(0, n_players, n_queries)
+    queries = [game.characters[row] for row in query_rows]
+    with timer.stage('get_recommendations', n_queries):
+        for character in queries:
+            recommender.get_recommendations(character)
+    batch = recommender.feature_matrix(rng.integers(0, n_players, batch_size))
+    with timer.stage('get_recommendations_batch', batch_size):
+        recommender.get_recommendations_batch(batch, 5)
+
+    # Exact sharded search at each worker count; the pool is started before timing
+    batch_scaled = recommender.transform(batch)
+    for n_workers in workers:
+        backend = ShardedBruteForceBackend(n_workers=n_workers).fit(recommender.scaled_features())
+        backend.kneighbors(batch_scaled[:1], 5)
+        with timer.stage(f'kneighbors_sharded_{n_workers}', batch_size):
+            backend.kneighbors(batch_scaled, 5)
+        backend.close()
+
+    with timer.stage('recommend_items_for_character', n_queries):
+        for character in queries:
+            recommender.recommend_items_for_character(character)
+    with timer.stage('recommend_items_batch', batch_size):
+        recommender.recommend_items_batch(batch, 5)
+
+    directory = tempfile.mkdtemp(prefix='knn_rpg_benchmark_')
+    try:
+        columnar_path = os.path.join(directory, 'state')
+        with timer.stage('save_game_state_columnar', n_players):
+            game.save_game_state(columnar_path, file_format='columnar')
+        with timer.stage('load_game_state_columnar', n_players):
+            RPGInventory().load_game_state(columnar_path)
+
+        # The JSON path materializes every character, so it is skipped for the largest populations
+        if n_players <= json_max_players:
+            json_path = os.path.join(directory, 'state.json')
+            with timer.stage('save_game_state_json', n_players):
+                game.save_game_state(json_path)
+            with timer.stage('load_game_state_json', n_players):
+                RPGInventory().load_game_state(json_path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return timer.results
+
+def configurations(players, items, grid):
+    if grid:
+        return [(n_players, n_items) for n_players in players for n_items in items]
+    # Sweep players against the built-in catalog, then items against a mid-sized population
+    base_players = 10000 if 10000 in players else players[len(players) // 2]
+    sweep = [(n_players, items[0]) for n_players in players]
+    sweep += [(base_players, n_items) for n_items in items[1:]]
+    return sweep
+
+def rss_text(value, sign=''):
+    return f"{'n/a':>10}   " if value is None else f"{value:{sign}10.1f} MB"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the KNN RPG recommender pipeline')
+    parser.add_argument('--players', type=int, nargs='+', default=PLAYER_SWEEP)
+    parser.add_argument('--items', type=int, nargs='+', default=ITEM_SWEEP)
+    parser.add_argument('--grid', action='store_true', help='run every players x items combination')
+    parser.add_argument('--queries', type=int, default=20, help='single-character calls per stage')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per batched call')
+    parser.add_argument('--json-max-players', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='*', default=sorted({1, os.cpu_count() or 1}),
+                        help='worker counts for the sharded search stages')
+    parser.add_argument('--compact', action='store_true', help='uint8 character stats and an int8 quantized index')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.jsonl')
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    run = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+    with open(args.output, 'a') as f:
+        for n_players, n_items in configurations(args.players, args.items, args.grid):
+            queue = context.Queue()
+            process = context.Process(target=run_configuration, args=(
+                n_players, n_items, args.queries, args.batch_size, args.json_max_players, args.workers, args.compact,
+                args.seed, queue
+            ))
+            process.start()
+            results = queue.get()
+            process.join()
+            if isinstance(results, dict):
+                print(f"{n_players:>9} players {n_items:>7} items  failed: {results['error']}")
+                continue
+            for result in results:
+                f.write(json.dumps({**run, **result}) + '\n')
+                print(f"{n_players:>9} players {n_items:>7} items  {result['stage']:<30}"
+                      f"{result['wall_seconds']:>10.4f}s {result['rows_per_second'] or 0:>14.1f} rows/s"
+                      f"{rss_text(result['peak_rss_mb'])} stage peak {rss_text(result['rss_after_mb'])} after"
+                      f"{result['cumulative_peak_rss_mb']:>10.1f} MB peak so far")
+                if 'recommender_mb_per_million' in result:
+                    print(f"{n_players:>9} players {n_items:>7} items  {'recommender memory':<30}"
+                          f"{result['recommender_mb']:>10.1f} MB {result['recommender_mb_per_million']:>11.1f} MB/1M chars"
+                          f"  (index {result['index_mb']:.1f} MB)")
+            f.flush()
+    print(f"Benchmark results appended to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2996 @@
+import random
+import json
+import os
+import pickle
+import hashlib
+import time
+import functools
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from itertools import islice
+from collections import OrderedDict
+from collections.abc import Sequence
+import numpy as np
+
+# pandas, scikit-learn and the notebook display stack (ipywidgets, IPython.display, plotly,
+# seaborn, matplotlib) are imported inside the methods that need them, so batch workers
+# can import this module without paying for any of them
+
+COLOR_SCHEME = {
+    'background': '#2b2b2b',
+    'text': '#FFFFFF',
+    'primary': '#3498DB',
+    'secondary': '#E74C3C',
+    'accent': '#2ECC71',
+    'hover': '#9b9b9b',
+    'common': '#B0B0B0',
+    'uncommon': '#55AA55',
+    'rare': '#5555FF',
+    'epic': '#AA55AA',
+    'legendary': '#FFAA00',
+}
+
+styles = f"""
+<style>
+    #inventory-container {{
+        width: 100%;
+        max-width: 600px;
+        margin: 0 auto;
+    }}
+    .inventory-grid {{
+        display: grid;
+        grid-template-columns: repeat(5, 1fr);
+        gap: 10px;
+        padding: 20px;
+        background-color: {COLOR_SCHEME['background']};
+    }}
+    .item {{
+        width: 60px;
+        height: 60px;
+        background-color: {COLOR_SCHEME['primary']};
+        border: 2px solid {COLOR_SCHEME['accent']};
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        font-weight: bold;
+        color: {COLOR_SCHEME['text']};
+        cursor: move;
+        position: relative;
+    }}
+    .item:hover {{
+        background-color: {COLOR_SCHEME['hover']};
+    }}
+    .tooltip {{
+        visibility: hidden;
+        width: 120px;
+        background-color: {COLOR_SCHEME['secondary']};
+        color: {COLOR_SCHEME['text']};
+        text-align: center;
+        border-radius: 6px;
+        padding: 5px;
+        position: absolute;
+        z-index: 1;
+        bottom: 125%;
+        left: 50%;
+        margin-left: -60px;
+        opacity: 0;
+        transition: opacity 0.3s;
+    }}
+    .item:hover .tooltip {{
+        visibility: visible;
+        opacity: 1;
+    }}
+    .control-panel {{
+        margin-top: 20px;
+        display: flex;
+        justify-content: space-around;
+    }}
+    .character-stats {{
+        display: flex;
+        align-items: flex-start;
+        margin-top: 20px;
+        background-color: {COLOR_SCHEME['background']};
+        padding: 20px;
+        border-radius: 8px;
+        color: {COLOR_SCHEME['text']};
+    }}
+    .character-image {{
+        width: 100px;
+        height: 100px;
+        background-color: {COLOR_SCHEME['primary']};
+        border-radius: 50%;
+        margin-right: 20px;
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        font-size: 24px;
+        font-weight: bold;
+    }}
+    .character-details {{
+        flex: 1;
+        display: grid;
+        grid-template-columns: 1fr 1fr;
+        gap: 10px;
+    }}
+    .stat-label {{
+        font-weight: bold;
+    }}
+    .radar-chart {{
+        margin-top: 20px;
+    }}
+    .item-card {{
+        width: 200px;
+        background-color: {COLOR_SCHEME['background']};
+        border: 2px solid {COLOR_SCHEME['accent']};
+        border-radius: 8px;
+        padding: 10px;
+        margin: 10px;
+        color: {COLOR_SCHEME['text']};
+    }}
+    .item-name {{
+        font-weight: bold;
+        font-size: 18px;
+        margin-bottom: 5px;
+    }}
+    .item-type {{
+        font-style: italic;
+        margin-bottom: 5px;
+    }}
+    .item-stats {{
+        display: grid;
+        grid-template-columns: 1fr 1fr;
+        gap: 5px;
+    }}
+    .common {{ color: {COLOR_SCHEME['common']}; }}
+    .uncommon {{ color: {COLOR_SCHEME['uncommon']}; }}
+    .rare {{ color: {COLOR_SCHEME['rare']}; }}
+    .epic {{ color: {COLOR_SCHEME['epic']}; }}
+    .legendary {{ color: {COLOR_SCHEME['legendary']}; }}
+</style>
+"""
+
+# Front end of the inventory widget (an anywidget ES module). The view asks the kernel for the
+# inventory when it renders, then applies the seq-numbered add/remove/move ops it receives; a gap
+# in the sequence asks for a full reset. Drops are sent to the kernel as move requests and the
+# slot moves when the op comes back
+inventory_js = """
+function render({ model, el }) {
+    var state = {seq: 0, syncing: false, dragged: null};
+    var container = document.createElement('div');
+    container.id = 'inventory-container';
+    var grid = document.createElement('div');
+    grid.className = 'inventory-grid';
+    container.appendChild(grid);
+    el.appendChild(container);
+
+    function slotIndex(slot) {
+        return Array.prototype.indexOf.call(grid.children, slot);
+    }
+
+    function allowDrop(ev) {
+        ev.preventDefault();
+    }
+
+    function drag(ev) {
+        state.dragged = ev.target.closest('.item');
+        ev.dataTransfer.setData('text', String(slotIndex(state.dragged)));
+    }
+
+    function drop(ev) {
+        ev.preventDefault();
+        var target = ev.target.closest('.item');
+        if (!target || !state.dragged || target === state.dragged || target.parentNode !== grid) {
+            return;
+        }
+        model.send({op: 'move', from: slotIndex(state.dragged), to: slotIndex(target)});
+    }
+
+    function emptySlot() {
+        var slot = document.createElement('div');
+        slot.className = 'item';
+        slot.ondrop = drop;
+        slot.ondragover = allowDrop;
+        return slot;
+    }
+
+    function fillSlot(slot, item) {
+        slot.className = `item ${item.rarity.toLowerCase()}`;
+        slot.draggable = true;
+        slot.ondragstart = drag;
+        slot.textContent = item.name;
+        var tooltip = document.createElement('span');
+        tooltip.className = 'tooltip';
+        tooltip.textContent = item.item_type;
+        slot.appendChild(tooltip);
+    }
+
+    function sync() {
+        if (!state.syncing) {
+            state.syncing = true;
+            model.send({op: 'sync'});
+        }
+    }
+
+    function applyOp(message) {
+        if (message.op === 'reset') {
+            grid.innerHTML = '';
+            message.items.forEach(item => {
+                var slot = emptySlot();
+                fillSlot(slot, item);
+                grid.appendChild(slot);
+            });
+            for (let i = message.items.length; i < message.max_items; i++) {
+                grid.appendChild(emptySlot());
+            }
+            state.seq = message.seq;
+            state.syncing = false;
+            return;
+        }
+        if (state.syncing || message.seq !== state.seq + 1) {
+            sync();
+            return;
+        }
+        state.seq = message.seq;
+        if (message.op === 'add') {
+            fillSlot(grid.children[message.slot], message.item);
+        } else if (message.op === 'remove') {
+            grid.removeChild(grid.children[message.slot]);
+            grid.appendChild(emptySlot());
+        } else if (message.op === 'move') {
+            var slot = grid.children[message.from];
+            grid.removeChild(slot);
+            grid.insertBefore(slot, grid.children[message.to] || null);
+        }
+    }
+
+    model.on('msg:custom', applyOp);
+    sync();
+    return () => model.off('msg:custom', applyOp);
+}
+
+export default { render };
+"""
+
+CHARACTER_CLASSES = ['Warrior', 'Mage', 'Rogue']
+FEATURES = ['strength', 'intelligence', 'dexterity', 'level']
+ITEM_STATS = ['strength', 'intelligence', 'dexterity']
+ITEM_TYPES = ['Weapon', 'Armor', 'Consumable', 'Material', 'Artifact']
+RARITIES = ['Common', 'Uncommon', 'Rare', 'Epic', 'Legendary']
+
+class Instrumentation:
+    # Per-stage call counts and timings for the recommender and game hot paths. While disabled,
+    # an instrumented method costs one attribute check on top of the call itself
+    def __init__(self, enabled=False, hook=None):
+        self.enabled = enabled
+        # hook(stage, seconds, rows) is called for every recorded call, e.g. to forward to a metrics pipeline
+        self.hook = hook
+        self.stats = {}
+
+    def enable(self, hook=None):
+        self.enabled = True
+        if hook is not None:
+            self.hook = hook
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, stage, seconds, rows=0):
+        stats = self.stats.get(stage)
+        if stats is None:
+            stats = self.stats[stage] = {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'rows': 0}
+        stats['calls'] += 1
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['rows'] += rows
+        if self.hook is not None:
+            self.hook(stage, seconds, rows)
+
+    def snapshot(self):
+        return {
+            stage: {**stats, 'avg_seconds': stats['total_seconds'] / stats['calls']}
+            for stage, stats in self.stats.items()
+        }
+
+    def reset(self):
+        self.stats = {}
+
+def instrumented(stage, rows=None):
+    # Times a method of an object with an `instrumentation` attribute; rows(self, result) gives
+    # the number of rows the call processed
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            completed = False
+            try:
+                result = method(self, *args, **kwargs)
+                completed = True
+                return result
+            finally:
+                # Calls that raise are timed too, with no rows
+                processed = rows(self, result) if completed and rows is not None else 0
+                instrumentation.record(stage, time.perf_counter() - start, processed)
+        return wrapper
+    return decorate
+
+def first_length(_, result):
+    return len(result[0])
+
+def result_length(_, result):
+    return len(result)
+
+class Item:
+    # Item instances are shared through ItemCatalog, so keep them small
+    __slots__ = ('name', 'item_type', 'rarity', 'power', 'required_stats')
+
+    def __init__(self, name, item_type, rarity, power, required_stats):
+        self.name = name
+        self.item_type = item_type
+        self.rarity = rarity
+        self.power = power
+        self.required_stats = required_stats
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'item_type': self.item_type,
+            'rarity': self.rarity,
+            'power': self.power,
+            'required_stats': self.required_stats
+        }
+
+    def create_item_card(self):
+        return f"""
+        <div class="item-card">
+            <div class="item-name {self.rarity.lower()}">{self.name}</div>
+            <div class="item-type">{self.item_type}</div>
+            <div class="item-stats">
+                <div>Rarity:</div><div class="{self.rarity.lower()}">{self.rarity}</div>
+                <div>Power:</div><div>{self.power}</div>
+                <div>Required Stats:</div><div>{', '.join(f'{k}: {v}' for k, v in self.required_stats.items())}</div>
+            </div>
+        </div>
+        """
+
+class ItemCatalog:
+    # Interns items by name: each item has a single shared Item instance and a small integer id
+    # (its position), and inventories everywhere else hold only the ids
+    def __init__(self, items=()):
+        self.items = []
+        self.ids = {}
+        # Bumped whenever items are added or replaced; generation only when replaced, i.e. when
+        # existing ids change meaning
+        self.version = 0
+        self.generation = 0
+        self.compiled = None
+        self.compiled_version = None
+        # Card HTML by item id; ids only change meaning when the catalog is replaced
+        self.cards = {}
+        self.add_many(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        return self.add_many([item])[0]
+
+    def add_many(self, items):
+        item_ids = []
+        added = False
+        for item in items:
+            item_id = self.ids.get(item.name)
+            if item_id is None:
+                item_id = self.ids[item.name] = len(self.items)
+                self.items.append(item)
+                added = True
+            item_ids.append(item_id)
+        if added:
+            self.version += 1
+        return item_ids
+
+    def replace(self, items):
+        self.items = []
+        self.ids = {}
+        self.cards = {}
+        self.add_many(items)
+        self.version += 1
+        self.generation += 1
+
+    def item_ids(self, items):
+        # Items not in the catalog yet are interned on the way
+        return self.add_many(items)
+
+    def items_for_ids(self, item_ids):
+        return [self.items[item_id] for item_id in item_ids]
+
+    def register_items(self, item_dicts):
+        item_ids = []
+        for item_data in item_dicts:
+            item_id = self.ids.get(item_data['name'])
+            if item_id is None:
+                item_id = self.add(Item(**item_data))
+            item_ids.append(item_id)
+        return item_ids
+
+    def compile(self):
+        # Column arrays over the catalog, rebuilt only when it changes
+        if self.compiled_version != self.version:
+            rarity_names = list(RARITIES) + sorted({item.rarity for item in self.items} - set(RARITIES))
+            type_names = list(ITEM_TYPES) + sorted({item.item_type for item in self.items} - set(ITEM_TYPES))
+            self.compiled = {
+                'records': [item.to_dict() for item in self.items],
+                'required_stats': np.array(
+                    [[item.required_stats.get(stat, 0) for stat in ITEM_STATS] for item in self.items],
+                    dtype=np.int32
+                ).reshape(len(self.items), len(ITEM_STATS)),
+                'power': np.array([item.power for item in self.items], dtype=np.int32),
+                'rarity_names': rarity_names,
+                'rarity_code': np.array([rarity_names.index(item.rarity) for item in self.items], dtype=np.int8),
+                'type_names': type_names,
+                'type_code': np.array([type_names.index(item.item_type) for item in self.items], dtype=np.int16),
+                'frame': None,
+            }
+            self.compiled_version = self.version
+        return self.compiled
+
+    def records(self):
+        return self.compile()['records']
+
+    def card_html(self, item_id):
+        card = self.cards.get(item_id)
+        if card is None:
+            card = self.cards[item_id] = self.items[item_id].create_item_card()
+        return card
+
+    def query(self, rarity=None, item_type=None, min_power=None, max_power=None, sort_by='id', descending=False):
+        # Ids of the matching items in display order, filtered and sorted on the compiled columns
+        compiled = self.compile()
+        mask = np.ones(len(self.items), dtype=bool)
+        if rarity is not None:
+            mask &= compiled['rarity_code'] == compiled['rarity_names'].index(rarity) if rarity in compiled['rarity_names'] else False
+        if item_type is not None:
+            mask &= compiled['type_code'] == compiled['type_names'].index(item_type) if item_type in compiled['type_names'] else False
+        if min_power is not None:
+            mask &= compiled['power'] >= min_power
+        if max_power is not None:
+            mask &= compiled['power'] <= max_power
+        item_ids = np.flatnonzero(mask)
+        if sort_by != 'id':
+            keys = {'power': compiled['power'], 'rarity': compiled['rarity_code'], 'item_type': compiled['type_code']}
+            if sort_by not in keys:
+                raise ValueError(f"Unknown sort key '{sort_by}', expected 'id' or one of {sorted(keys)}")
+            # Stable, so items with equal keys stay in id order either way
+            key = keys[sort_by][item_ids]
+            item_ids = item_ids[np.argsort(-key.astype(np.int64) if descending else key, kind='stable')]
+        elif descending:
+            item_ids = item_ids[::-1]
+        return item_ids
+
+    def to_frame(self):
+        import pandas as pd
+
+        compiled = self.compile()
+        if compiled['frame'] is None:
+            compiled['frame'] = pd.DataFrame(compiled['records'], columns=['name', 'item_type', 'rarity', 'power', 'required_stats'])
+        return compiled['frame']
+
+class InventoryList(list):
+    # The items of a character in a store. The store only keeps item ids, so every in-place edit
+    # (append, remove, slicing, ...) is written back through the character's inventory setter
+    def __init__(self, character, items):
+        super().__init__(items)
+        self.character = character
+
+    def write_back(self):
+        self.character.inventory = list(self)
+
+def write_through(name):
+    method = getattr(list, name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.write_back()
+        return result
+    return wrapper
+
+for name in ('append', 'extend', 'insert', 'remove', 'pop', 'clear', 'sort', 'reverse',
+             '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+    setattr(InventoryList, name, write_through(name))
+
+class Character:
+    # Set by CharacterStore.add so that stat and inventory edits are written through to the store
+    _store = None
+    _row = None
+    _inventory = None
+
+    def __init__(self, name, char_class, level=1):
+        self.name = name
+        self.char_class = char_class
+        self.level = level
+        self.strength = random.randint(1, 20)
+        self.intelligence = random.randint(1, 20)
+        self.dexterity = random.randint(1, 20)
+        self.inventory = []
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'class': self.char_class,
+            'level': self.level,
+            'strength': self.strength,
+            'intelligence': self.intelligence,
+            'dexterity': self.dexterity,
+            'inventory': [item.to_dict() for item in self.inventory]
+        }
+
+    def __setattr__(self, attribute, value):
+        # The store goes first so a value it refuses is not kept on the character either
+        if self._store is not None and attribute in CharacterStore.TRACKED_ATTRIBUTES:
+            self._store.set_value(self._row, attribute, value)
+        super().__setattr__(attribute, value)
+
+    @property
+    def inventory(self):
+        # Characters in a store keep only item ids there; the shared Items are looked up on access
+        if self._store is not None:
+            return InventoryList(self, self._store.inventory_items(self._row))
+        return self._inventory
+
+    @inventory.setter
+    def inventory(self, items):
+        if self._store is not None:
+            self._store.set_inventory(self._row, items)
+        else:
+            self._inventory = list(items)
+
+    @property
+    def inventory_ids(self):
+        if self._store is not None:
+            return self._store.inventory_ids(self._row).copy()
+        return None
+
+    @classmethod
+    def from_stats(cls, name, char_class, level, strength, intelligence, dexterity, inventory=()):
+        # Builds a character with known stats without drawing random ones first
+        character = cls.__new__(cls)
+        character.name = name
+        character.char_class = char_class
+        character.level = level
+        character.strength = strength
+        character.intelligence = intelligence
+        character.dexterity = dexterity
+        character.inventory = list(inventory)
+        return character
+
+    @classmethod
+    def from_dict(cls, data, item_catalog=None):
+        # With an item_catalog the inventory shares its Item instances, registering unknown items
+        character = cls(data['name'], data['class'], data['level'])
+        character.strength = data['strength']
+        character.intelligence = data['intelligence']
+        character.dexterity = data['dexterity']
+        if item_catalog is None:
+            character.inventory = [Item(**item_data) for item_data in data['inventory']]
+        else:
+            character.inventory = item_catalog.items_for_ids(item_catalog.register_items(data['inventory']))
+        return character
+
+class CharacterStore:
+    # Struct-of-arrays copy of the character attributes the recommender reads,
+    # kept in sync with the Character objects so feature matrices never need a to_dict() pass
+    STAT_COLUMNS = ['strength', 'intelligence', 'dexterity', 'level']
+    TRACKED_ATTRIBUTES = {'name', 'char_class', 'strength', 'intelligence', 'dexterity', 'level'}
+
+    def __init__(self, capacity=1024, item_catalog=None, compact=False):
+        self.size = 0
+        # Compact stores keep the stats as uint8, a quarter of the default int32
+        self.compact = compact
+        self.stat_dtype = np.uint8 if compact else np.int32
+        self.columns = {column: np.zeros(capacity, dtype=self.stat_dtype) for column in self.STAT_COLUMNS}
+        self.columns['class_code'] = np.zeros(capacity, dtype=np.int16)
+        # Inventories are item ids in a shared pool; each row points at its own segment.
+        # A replacement that fits is written over the old segment, a longer one is appended and
+        # the pool is compacted once more than half of it is dead
+        self.columns['inventory_start'] = np.zeros(capacity, dtype=np.int64)
+        self.columns['inventory_count'] = np.zeros(capacity, dtype=np.int32)
+        self.inventory_pool = np.zeros(capacity, dtype=np.int32)
+        self.inventory_pool_size = 0
+        self.dead_inventory_items = 0
+        # ItemCatalog that inventory item ids refer to
+        self.item_catalog = item_catalog
+        self.class_names = list(CHARACTER_CLASSES)
+        self.class_codes = {char_class: code for code, char_class in enumerate(self.class_names)}
+        self.names = []
+        # Character objects are only built when a row is first accessed through character()
+        self.characters = []
+        self.listeners = []
+        # Bumped on every change to any row
+        self.version = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.columns['class_code'])
+
+    def reserve(self, n_rows):
+        if n_rows <= self.capacity:
+            return
+        new_capacity = max(n_rows, 2 * self.capacity)
+        for column, values in self.columns.items():
+            grown = np.zeros(new_capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[column] = grown
+
+    def append_inventory_items(self, item_ids):
+        item_ids = np.asarray(item_ids, dtype=np.int32)
+        start = self.inventory_pool_size
+        end = start + len(item_ids)
+        if end > len(self.inventory_pool):
+            grown = np.zeros(max(end, 2 * len(self.inventory_pool)), dtype=np.int32)
+            grown[:start] = self.inventory_pool[:start]
+            self.inventory_pool = grown
+        self.inventory_pool[start:end] = item_ids
+        self.inventory_pool_size = end
+        return start
+
+    def inventory_ids(self, row):
+        start = self.columns['inventory_start'][row]
+        return self.inventory_pool[start:start + self.columns['inventory_count'][row]]
+
+    def inventory_items(self, row):
+        if self.item_catalog is None:
+            return []
+        return self.item_catalog.items_for_ids(self.inventory_ids(row).tolist())
+
+    def set_inventory(self, row, inventory):
+        item_ids = self.item_catalog.item_ids(inventory) if self.item_catalog is not None else []
+        # Rows being added by add_many are announced by its 'add' event instead
+        existing = row < self.size
+        if existing:
+            self.notify_before('inventory', [row])
+        old_count = int(self.columns['inventory_count'][row]) if existing else 0
+        if existing and len(item_ids) <= old_count:
+            start = self.columns['inventory_start'][row]
+            self.inventory_pool[start:start + len(item_ids)] = item_ids
+            dead = old_count - len(item_ids)
+        else:
+            self.columns['inventory_start'][row] = self.append_inventory_items(item_ids)
+            dead = old_count
+        self.columns['inventory_count'][row] = len(item_ids)
+        if existing:
+            self.release_inventory_items(dead)
+            self.notify('inventory', [row])
+        else:
+            self.version += 1
+
+    def release_inventory_items(self, count):
+        # Counts pool entries no row points at any more, compacting the pool once they are the majority
+        self.dead_inventory_items += count
+        if self.dead_inventory_items > max(1024, self.inventory_pool_size // 2):
+            self.compact_inventory_pool()
+
+    def compact_inventory_pool(self):
+        offsets, items = self.inventory_csr()
+        self.inventory_pool = items
+        self.inventory_pool_size = len(items)
+        self.columns['inventory_start'][:self.size] = offsets[:-1]
+        self.dead_inventory_items = 0
+
+    def attach(self, character, row):
+        object.__setattr__(character, '_store', self)
+        object.__setattr__(character, '_row', row)
+        object.__setattr__(character, '_inventory', None)
+
+    def detach(self, character):
+        # The character keeps its items once it no longer reads them from the store
+        inventory = self.inventory_items(character._row)
+        object.__setattr__(character, '_store', None)
+        object.__setattr__(character, '_row', None)
+        object.__setattr__(character, '_inventory', inventory)
+
+    def writable_names(self):
+        # Names loaded from a columnar save stay a numpy array until the first edit
+        if not isinstance(self.names, list):
+            self.names = self.names.tolist()
+        return self.names
+
+    def subscribe(self, listener):
+        # listener(event, rows) is called after every 'add', 'update', 'inventory', 'remove' and
+        # 'clear', and with 'before_update', 'before_inventory' and 'before_remove' while the rows
+        # still hold their old values
+        self.listeners.append(listener)
+
+    def notify(self, event, rows):
+        self.version += 1
+        for listener in self.listeners:
+            listener(event, rows)
+
+    def notify_before(self, event, rows):
+        for listener in self.listeners:
+            listener(f'before_{event}', rows)
+
+    def class_code(self, char_class):
+        if char_class not in self.class_codes:
+            self.class_codes[char_class] = len(self.class_names)
+            self.class_names.append(char_class)
+        return self.class_codes[char_class]
+
+    def stat_values(self, column, values):
+        # Values that would wrap around in a compact store are refused rather than stored
+        values = np.asarray(values)
+        if self.compact and values.size and (values.min() < 0 or values.max() > 255):
+            raise ValueError(f"'{column}' must be between 0 and 255 in a compact character store")
+        return values
+
+    def add(self, character):
+        return self.add_many([character])[0]
+
+    def add_many(self, characters):
+        start, count = self.size, len(characters)
+        self.reserve(start + count)
+        rows = range(start, start + count)
+        for column in self.STAT_COLUMNS:
+            self.columns[column][start:start + count] = self.stat_values(column, np.fromiter(
+                (getattr(character, column) for character in characters), dtype=np.int64, count=count
+            ))
+        self.columns['class_code'][start:start + count] = np.fromiter(
+            (self.class_code(character.char_class) for character in characters), dtype=np.int16, count=count
+        )
+        for row, character in zip(rows, characters):
+            inventory = character.inventory
+            self.attach(character, row)
+            self.set_inventory(row, inventory)
+        self.writable_names().extend(character.name for character in characters)
+        self.characters.extend(characters)
+        self.size += count
+        self.notify('add', rows)
+        return rows
+
+    def add_columns(self, names, class_codes, strength, intelligence, dexterity, level,
+                    inventory_counts=None, inventory_items=None):
+        # Bulk append straight from arrays; no Character objects are created
+        start, count = self.size, len(level)
+        self.reserve(start + count)
+        rows = range(start, start + count)
+        values = {
+            'strength': strength, 'intelligence': intelligence, 'dexterity': dexterity,
+            'level': level, 'class_code': class_codes
+        }
+        for column, column_values in values.items():
+            self.columns[column][start:start + count] = self.stat_values(column, column_values)
+        if inventory_counts is None:
+            inventory_counts = np.zeros(count, dtype=np.int32)
+            inventory_items = np.zeros(0, dtype=np.int32)
+        pool_start = self.append_inventory_items(inventory_items)
+        offsets = np.zeros(count, dtype=np.int64)
+        np.cumsum(inventory_counts[:-1], out=offsets[1:])
+        self.columns['inventory_start'][start:start + count] = pool_start + offsets
+        self.columns['inventory_count'][start:start + count] = inventory_counts
+        self.writable_names().extend(names)
+        self.characters.extend([None] * count)
+        self.size += count
+        self.notify('add', rows)
+        return rows
+
+    def character(self, row):
+        if not 0 <= row < self.size:
+            raise IndexError(f"Character row {row} out of range")
+        character = self.characters[row]
+        if character is None:
+            character = Character.from_stats(
+                self.names[row],
+                self.class_names[self.columns['class_code'][row]],
+                *(int(self.columns[column][row]) for column in ['level', 'strength', 'intelligence', 'dexterity'])
+            )
+            self.attach(character, row)
+            self.characters[row] = character
+        return character
+
+    def set_value(self, row, attribute, value):
+        if attribute == 'name':
+            self.writable_names()[row] = value
+            self.version += 1
+            return
+        if attribute != 'char_class':
+            value = self.stat_values(attribute, value)
+        self.notify_before('update', [row])
+        if attribute == 'char_class':
+            self.columns['class_code'][row] = self.class_code(value)
+        else:
+            self.columns[attribute][row] = value
+        self.notify('update', [row])
+
+    def remove(self, row):
+        # Swap-remove: the last row moves into the freed slot so the columns stay contiguous
+        last = self.size - 1
+        # Names loaded from a columnar save become a list first, before listeners hear of the removal
+        names = self.writable_names()
+        self.notify_before('remove', [row])
+        removed = self.characters[row]
+        if removed is not None:
+            self.detach(removed)
+        dead = int(self.columns['inventory_count'][row])
+        if row != last:
+            for values in self.columns.values():
+                values[row] = values[last]
+            names[row] = names[last]
+            self.characters[row] = self.characters[last]
+            if self.characters[row] is not None:
+                object.__setattr__(self.characters[row], '_row', row)
+        names.pop()
+        self.characters.pop()
+        self.size -= 1
+        self.release_inventory_items(dead)
+        self.notify('remove', [row, last])
+        return removed
+
+    def clear(self):
+        for character in self.characters:
+            if character is not None:
+                self.detach(character)
+        self.size = 0
+        self.inventory_pool_size = 0
+        self.dead_inventory_items = 0
+        self.names = []
+        self.characters = []
+        self.notify('clear', [])
+
+    def column(self, column):
+        return self.columns[column][:self.size]
+
+    def inventory_csr(self):
+        # Compacts the inventory pool into CSR form: row i owns items[offsets[i]:offsets[i + 1]]
+        counts = self.column('inventory_count')
+        offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        positions = np.repeat(self.column('inventory_start') - offsets[:-1], counts) + np.arange(offsets[-1])
+        return offsets, self.inventory_pool[positions]
+
+    def save_columns(self, directory, meta=None):
+        # Every file is written under a temporary name and then renamed over the old one, meta.json
+        # last. The directory this store is memory-mapped from can be saved over that way: the
+        # existing maps keep the old files, which np.save would otherwise truncate under them
+        os.makedirs(directory, exist_ok=True)
+        arrays = {column: self.column(column) for column in self.STAT_COLUMNS + ['class_code']}
+        arrays['inventory_offsets'], arrays['inventory_items'] = self.inventory_csr()
+        arrays['names'] = np.asarray(self.names, dtype=str)
+        paths = []
+        for name, values in arrays.items():
+            path = os.path.join(directory, f'{name}.npy')
+            with open(f'{path}.tmp', 'wb') as f:
+                np.save(f, values)
+            paths.append(path)
+        meta = {**(meta or {}), 'size': self.size, 'class_names': self.class_names}
+        path = os.path.join(directory, 'meta.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(meta, f, default=int)
+        paths.append(path)
+        for path in paths:
+            os.replace(f'{path}.tmp', path)
+        return meta
+
+    def load_columns(self, directory, meta, mmap=True):
+        # With mmap the arrays are copy-on-write views of the files, so loading costs no reads
+        # and edits never touch the save
+        def load(name):
+            path = os.path.join(directory, f'{name}.npy')
+            try:
+                return np.load(path, mmap_mode='c' if mmap else None)
+            except ValueError:
+                # Empty arrays can't be memory-mapped
+                return np.load(path)
+
+        self.clear()
+        for column in self.STAT_COLUMNS + ['class_code']:
+            self.columns[column] = load(column)
+        for column in self.STAT_COLUMNS:
+            # Saves from a store of the other kind are converted (and so no longer memory-mapped)
+            if self.columns[column].dtype != self.stat_dtype:
+                self.columns[column] = self.stat_values(column, self.columns[column]).astype(self.stat_dtype)
+        offsets = load('inventory_offsets')
+        self.columns['inventory_start'] = offsets[:-1]
+        self.columns['inventory_count'] = np.diff(offsets).astype(np.int32)
+        self.inventory_pool = load('inventory_items')
+        self.inventory_pool_size = len(self.inventory_pool)
+        self.names = load('names')
+        self.class_names = list(meta['class_names'])
+        self.class_codes = {char_class: code for code, char_class in enumerate(self.class_names)}
+        self.size = meta['size']
+        self.characters = [None] * self.size
+        self.notify('add', range(self.size))
+
+    def to_frame(self, rows=None):
+        # rows selects a subset; the frame is then indexed by store row
+        import pandas as pd
+
+        class_names = np.array(self.class_names, dtype=object)
+        if rows is None:
+            data = {
+                'name': self.names,
+                'class': class_names[self.column('class_code')],
+            }
+            for column in self.STAT_COLUMNS:
+                data[column] = self.column(column)
+            return pd.DataFrame(data)
+        rows = np.asarray(rows, dtype=np.intp)
+        data = {
+            'name': [self.names[row] for row in rows],
+            'class': class_names[self.column('class_code')[rows]],
+        }
+        for column in self.STAT_COLUMNS:
+            data[column] = self.column(column)[rows]
+        return pd.DataFrame(data, index=rows)
+
+class PopulationStats:
+    # Running aggregates of a CharacterStore, maintained from its change events: per-class counts,
+    # stat sums and sums of squares, per-class stat histograms, a strength x intelligence joint
+    # histogram and an inventory-size histogram. Summaries cost O(classes + bins) whatever the
+    # population size. Values above the last bin are counted in it
+    def __init__(self, store, stat_bins=101, inventory_bins=33):
+        self.store = store
+        self.stat_bins = stat_bins
+        self.inventory_bins = inventory_bins
+        self.reset()
+        store.subscribe(self.on_store_change)
+        if len(store):
+            self.apply(range(len(store)), 1)
+
+    def reset(self):
+        n_classes = len(self.store.class_names)
+        n_stats = len(CharacterStore.STAT_COLUMNS)
+        self.counts = np.zeros(n_classes, dtype=np.int64)
+        self.sums = np.zeros((n_classes, n_stats), dtype=np.int64)
+        self.squares = np.zeros((n_classes, n_stats), dtype=np.int64)
+        self.histograms = np.zeros((n_stats, n_classes, self.stat_bins), dtype=np.int64)
+        self.joint_histogram = np.zeros((n_classes, self.stat_bins, self.stat_bins), dtype=np.int64)
+        self.inventory_histogram = np.zeros((n_classes, self.inventory_bins), dtype=np.int64)
+
+    def grow(self, n_classes):
+        # Classes first seen after construction get zeroed rows
+        extra = n_classes - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.pad(self.counts, (0, extra))
+        self.sums = np.pad(self.sums, ((0, extra), (0, 0)))
+        self.squares = np.pad(self.squares, ((0, extra), (0, 0)))
+        self.histograms = np.pad(self.histograms, ((0, 0), (0, extra), (0, 0)))
+        self.joint_histogram = np.pad(self.joint_histogram, ((0, extra), (0, 0), (0, 0)))
+        self.inventory_histogram = np.pad(self.inventory_histogram, ((0, extra), (0, 0)))
+
+    def on_store_change(self, event, rows):
+        if event in ('add', 'update', 'inventory'):
+            self.apply(rows, 1)
+        elif event in ('before_update', 'before_inventory', 'before_remove'):
+            self.apply(rows, -1)
+        elif event == 'clear':
+            self.reset()
+
+    def apply(self, rows, sign):
+        # Adds (sign=1) or subtracts (sign=-1) the contribution of rows
+        if isinstance(rows, range):
+            rows = slice(rows.start, rows.stop)
+        columns = self.store.columns
+        codes = columns['class_code'][rows].astype(np.intp)
+        if len(codes) == 0:
+            return
+        n_classes = max(len(self.store.class_names), int(codes.max()) + 1)
+        self.grow(n_classes)
+        n_classes = len(self.counts)
+        self.counts += sign * np.bincount(codes, minlength=n_classes)
+        binned = {}
+        for i, column in enumerate(CharacterStore.STAT_COLUMNS):
+            values = columns[column][rows].astype(np.int64)
+            self.sums[:, i] += sign * np.bincount(codes, weights=values, minlength=n_classes).astype(np.int64)
+            self.squares[:, i] += sign * np.bincount(codes, weights=values * values, minlength=n_classes).astype(np.int64)
+            binned[column] = np.clip(values, 0, self.stat_bins - 1)
+            self.histograms[i] += sign * np.bincount(
+                codes * self.stat_bins + binned[column], minlength=n_classes * self.stat_bins
+            ).reshape(n_classes, self.stat_bins)
+        self.joint_histogram += sign * np.bincount(
+            (codes * self.stat_bins + binned['strength']) * self.stat_bins + binned['intelligence'],
+            minlength=n_classes * self.stat_bins * self.stat_bins
+        ).reshape(n_classes, self.stat_bins, self.stat_bins)
+        inventory_sizes = np.clip(columns['inventory_count'][rows], 0, self.inventory_bins - 1)
+        self.inventory_histogram += sign * np.bincount(
+            codes * self.inventory_bins + inventory_sizes, minlength=n_classes * self.inventory_bins
+        ).reshape(n_classes, self.inventory_bins)
+
+    def class_means(self, stats=('strength', 'intelligence', 'dexterity')):
+        # DataFrame of mean stats for each class that has players
+        import pandas as pd
+
+        present = np.flatnonzero(self.counts)
+        columns = [CharacterStore.STAT_COLUMNS.index(stat) for stat in stats]
+        return pd.DataFrame(
+            self.sums[present][:, columns] / self.counts[present, None],
+            index=pd.Index([self.store.class_names[code] for code in present], name='class'),
+            columns=list(stats)
+        )
+
+    def class_std(self, stats=('strength', 'intelligence', 'dexterity')):
+        import pandas as pd
+
+        present = np.flatnonzero(self.counts)
+        columns = [CharacterStore.STAT_COLUMNS.index(stat) for stat in stats]
+        counts = self.counts[present, None]
+        means = self.sums[present][:, columns] / counts
+        return pd.DataFrame(
+            np.sqrt(np.maximum(self.squares[present][:, columns] / counts - means ** 2, 0)),
+            index=pd.Index([self.store.class_names[code] for code in present], name='class'),
+            columns=list(stats)
+        )
+
+    def stat_histogram(self, stat, char_class=None):
+        histograms = self.histograms[CharacterStore.STAT_COLUMNS.index(stat)]
+        if char_class is None:
+            return histograms.sum(axis=0)
+        code = self.store.class_codes.get(char_class)
+        return histograms[code] if code is not None and code < len(histograms) else np.zeros(self.stat_bins, dtype=np.int64)
+
+    def inventory_size_histogram(self):
+        return self.inventory_histogram.sum(axis=0)
+
+class CharacterSequence(Sequence):
+    # Read-only list view over a CharacterStore that materializes characters as they are accessed
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.character(row) for row in range(*index.indices(len(self.store)))]
+        if index < 0:
+            index += len(self.store)
+        return self.store.character(index)
+
+def select_k_smallest(distances, k):
+    # Row-wise k smallest values of a (n_queries, n_candidates) block, sorted ascending with
+    # ties broken on column position so every backend orders equal distances the same way
+    k = min(k, distances.shape[1])
+    n_rows = len(distances)
+    if k < distances.shape[1]:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        threshold = np.take_along_axis(distances, part, axis=1).max(axis=1)
+        # Only the entries at or below each row's threshold are looked at after this pass
+        rows, columns = np.nonzero(distances <= threshold[:, None])
+        ties = distances[rows, columns] == threshold[rows]
+        # Rank ties within their row (nonzero returns rows in order) and keep the first ones needed
+        tie_counts = np.cumsum(ties)
+        before = np.concatenate([[0], tie_counts])[np.searchsorted(rows, np.arange(n_rows))]
+        needed = k - np.bincount(rows[~ties], minlength=n_rows)
+        keep = ~ties | (tie_counts - before[rows] <= needed[rows])
+        columns = columns[keep].reshape(n_rows, k)
+    else:
+        columns = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    values = np.take_along_axis(distances, columns, axis=1)
+    order = np.argsort(values, axis=1, kind='stable')
+    return np.take_along_axis(values, order, axis=1), np.take_along_axis(columns, order, axis=1)
+
+class NeighborBackend:
+    # Interface for KNNRecommender indexes: fit on a scaled (n, d) matrix, then answer
+    # kneighbors(X, n_neighbors) with (distances, indices) arrays like sklearn does. Approximate
+    # backends that find fewer than n_neighbors candidates pad with inf distances and -1 indices
+    name = None
+
+    def fit(self, X):
+        raise NotImplementedError
+
+    def kneighbors(self, X, n_neighbors):
+        raise NotImplementedError
+
+    def nbytes(self):
+        # Memory held by the fitted index
+        return 0
+
+class BruteForceBackend(NeighborBackend):
+    # Exact single-process reference: the same feature-wise sums as the sharded backend, so the
+    # two return identical neighbors, ties included
+    name = 'brute'
+
+    def __init__(self, chunk_size=1024, max_block_values=2 ** 24):
+        self.chunk_size = chunk_size
+        # Caps the (queries, rows) distance block, so large indexes get smaller query chunks
+        self.max_block_values = max_block_values
+        self.columns = None
+
+    def fit(self, X):
+        self.columns = np.ascontiguousarray(np.asarray(X, dtype=np.float64).T)
+        return self
+
+    def kneighbors(self, X, n_neighbors):
+        X = np.asarray(X, dtype=np.float64)
+        chunk_size = max(1, min(self.chunk_size, self.max_block_values // max(self.columns.shape[1], 1)))
+        squared, indices = search_columns(self.columns, X, n_neighbors, chunk_size)
+        return np.sqrt(squared), indices
+
+    def nbytes(self):
+        return self.columns.nbytes if self.columns is not None else 0
+
+class SklearnBackend(NeighborBackend):
+    def __init__(self, algorithm='auto', leaf_size=30):
+        from sklearn.neighbors import NearestNeighbors
+
+        self.name = algorithm if algorithm != 'auto' else 'sklearn'
+        self.model = NearestNeighbors(algorithm=algorithm, leaf_size=leaf_size, metric='euclidean')
+
+    def fit(self, X):
+        self.model.fit(X)
+        return self
+
+    def kneighbors(self, X, n_neighbors):
+        return self.model.kneighbors(X, n_neighbors=n_neighbors)
+
+    def nbytes(self):
+        # The fitted copy of X, plus the tree arrays other than that copy
+        if not hasattr(self.model, '_fit_X'):
+            return 0
+        tree = getattr(self.model, '_tree', None)
+        tree_arrays = tree.get_arrays()[1:] if tree is not None else ()
+        return self.model._fit_X.nbytes + sum(array.nbytes for array in tree_arrays)
+
+class RandomProjectionForestBackend(NeighborBackend):
+    # Approximate index: each tree splits the rows on random hyperplanes at the median until
+    # leaves hold at most leaf_size rows; a query is compared exactly against the union of
+    # the leaves it falls into across all trees
+    name = 'rp_forest'
+
+    def __init__(self, n_trees=8, leaf_size=64, seed=0, chunk_size=256):
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.trees = []
+
+    def fit(self, X):
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        rng = np.random.default_rng(self.seed)
+        self.trees = [self.build_tree(rng) for _ in range(self.n_trees)]
+        return self
+
+    def build_tree(self, rng):
+        n, d = self.X.shape
+        normals, thresholds, children = [], [], []
+        leaves = []
+        stack = [(np.arange(n), None, 0)]
+        while stack:
+            rows, parent, side = stack.pop()
+            node = len(normals)
+            if parent is not None:
+                children[parent][side] = node
+            if len(rows) <= self.leaf_size:
+                normals.append(np.zeros(d))
+                thresholds.append(0.0)
+                children.append([-1, -1])
+                leaves.append((node, rows))
+                continue
+            normal = rng.standard_normal(d)
+            projection = self.X[rows] @ normal
+            # Split on rank rather than value so duplicate points can't produce an empty side
+            order = np.argsort(projection, kind='stable')
+            half = len(rows) // 2
+            normals.append(normal)
+            thresholds.append((projection[order[half - 1]] + projection[order[half]]) / 2)
+            children.append([-1, -1])
+            stack.append((rows[order[half:]], node, 1))
+            stack.append((rows[order[:half]], node, 0))
+
+        leaf_rows = np.full((len(normals), self.leaf_size), -1, dtype=np.intp)
+        for node, rows in leaves:
+            leaf_rows[node, :len(rows)] = rows
+        return {
+            'normals': np.array(normals),
+            'thresholds': np.array(thresholds),
+            'children': np.array(children, dtype=np.intp),
+            'leaf_rows': leaf_rows,
+        }
+
+    def find_leaves(self, tree, X):
+        nodes = np.zeros(len(X), dtype=np.intp)
+        active = tree['children'][nodes, 0] >= 0
+        while active.any():
+            current = nodes[active]
+            projection = (X[active] * tree['normals'][current]).sum(axis=1)
+            side = (projection > tree['thresholds'][current]).astype(np.intp)
+            nodes[active] = tree['children'][current, side]
+            active = tree['children'][nodes, 0] >= 0
+        return nodes
+
+    def kneighbors(self, X, n_neighbors):
+        X = np.asarray(X, dtype=np.float64)
+        n_neighbors = min(n_neighbors, len(self.X))
+        distances = np.full((len(X), n_neighbors), np.inf)
+        indices = np.full((len(X), n_neighbors), -1, dtype=np.intp)
+        for start in range(0, len(X), self.chunk_size):
+            chunk = X[start:start + self.chunk_size]
+            candidates = np.hstack([tree['leaf_rows'][self.find_leaves(tree, chunk)] for tree in self.trees])
+            # Sorting puts duplicates (the same row reached through several trees) side by side
+            candidates.sort(axis=1)
+            duplicate = np.zeros(candidates.shape, dtype=bool)
+            duplicate[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+            squared = ((self.X[candidates] - chunk[:, None, :]) ** 2).sum(axis=2)
+            squared[duplicate | (candidates < 0)] = np.inf
+            # The leaves hold at most n_trees * leaf_size candidates; any columns past what they
+            # produced keep the inf / -1 padding
+            chunk_distances, columns = select_k_smallest(squared, n_neighbors)
+            chunk_indices = np.take_along_axis(candidates, columns, axis=1)
+            chunk_indices[np.isinf(chunk_distances)] = -1
+            width = chunk_distances.shape[1]
+            distances[start:start + self.chunk_size, :width] = np.sqrt(chunk_distances)
+            indices[start:start + self.chunk_size, :width] = chunk_indices
+        return distances, indices
+
+    def nbytes(self):
+        if not self.trees:
+            return 0
+        return self.X.nbytes + sum(array.nbytes for tree in self.trees for array in tree.values())
+
+def search_columns(columns, queries, n_neighbors, chunk_size=256):
+    # Exact search over a feature-major (d, n) matrix, returning squared distances. They are summed
+    # feature by feature rather than through the |q|^2 + |x|^2 - 2q.x expansion, so a row's distance
+    # doesn't depend on which other rows share the block, and equal stat vectors tie exactly
+    n_neighbors = min(n_neighbors, columns.shape[1])
+    distances = np.empty((len(queries), n_neighbors))
+    indices = np.empty((len(queries), n_neighbors), dtype=np.intp)
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start + chunk_size]
+        squared = np.zeros((len(chunk), columns.shape[1]))
+        for feature in range(columns.shape[0]):
+            difference = np.subtract.outer(chunk[:, feature], columns[feature])
+            difference *= difference
+            squared += difference
+        distances[start:start + chunk_size], indices[start:start + chunk_size] = select_k_smallest(squared, n_neighbors)
+    return distances, indices
+
+# The shared-memory block a pool worker has mapped; only the latest fit is ever searched
+attached_shard = {'name': None, 'block': None, 'columns': None}
+
+def search_shard(block_name, shape, start, stop, queries, n_neighbors, chunk_size):
+    # Runs in a pool worker: exact search over rows [start, stop) of the shared matrix,
+    # returning global row indices
+    if attached_shard['name'] != block_name:
+        if attached_shard['block'] is not None:
+            attached_shard['columns'] = None
+            attached_shard['block'].close()
+        block = shared_memory.SharedMemory(name=block_name)
+        columns = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        attached_shard.update(name=block_name, block=block, columns=columns)
+    distances, indices = search_columns(attached_shard['columns'][:, start:stop], queries, n_neighbors, chunk_size)
+    return distances, indices + start
+
+def release_shared_block(block):
+    block.close()
+    block.unlink()
+
+class ShardedBruteForceBackend(NeighborBackend):
+    # Exact search with the matrix in shared memory, split into contiguous row shards that a
+    # process pool searches in parallel; only the queries are pickled per request. Per-shard
+    # top-k lists are merged with select_k_smallest in shard order, so the result, ties
+    # included, is the same for any number of shards or workers
+    name = 'sharded'
+
+    def __init__(self, n_workers=None, n_shards=None, chunk_size=256):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.n_shards = n_shards or self.n_workers
+        self.chunk_size = chunk_size
+        self.block = None
+        self.pool = None
+        # Release the block and stop the pool when the backend is dropped (e.g. on refit) or at exit
+        self.block_finalizer = None
+        self.pool_finalizer = None
+        self.columns = None
+        self.bounds = []
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.release_block()
+        # Stored feature-major so every shard is a contiguous slice of each feature
+        self.block = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        self.block_finalizer = weakref.finalize(self, release_shared_block, self.block)
+        self.columns = np.ndarray(X.shape[::-1], dtype=np.float64, buffer=self.block.buf)
+        self.columns[:] = X.T
+        self.bounds = np.linspace(0, len(X), min(self.n_shards, max(len(X), 1)) + 1).astype(int).tolist()
+        return self
+
+    def start_pool(self):
+        if self.pool is None:
+            # spawn keeps workers independent of whatever threads the parent has running
+            self.pool = ProcessPoolExecutor(self.n_workers, mp_context=multiprocessing.get_context('spawn'))
+            self.pool_finalizer = weakref.finalize(self, self.pool.shutdown)
+        return self.pool
+
+    def kneighbors(self, X, n_neighbors):
+        X = np.asarray(X, dtype=np.float64)
+        n_neighbors = min(n_neighbors, self.columns.shape[1])
+        if n_neighbors == 0:
+            return np.empty((len(X), 0)), np.empty((len(X), 0), dtype=np.intp)
+        pool = self.start_pool()
+        futures = [
+            pool.submit(search_shard, self.block.name, self.columns.shape, start, stop, X, n_neighbors, self.chunk_size)
+            for start, stop in zip(self.bounds[:-1], self.bounds[1:]) if stop > start
+        ]
+        results = [future.result() for future in futures]
+        # Merge on squared distances: distinct squares can round to the same square root
+        squared, columns = select_k_smallest(np.hstack([result[0] for result in results]), n_neighbors)
+        indices = np.take_along_axis(np.hstack([result[1] for result in results]), columns, axis=1)
+        return np.sqrt(squared), indices
+
+    def nbytes(self):
+        return self.columns.nbytes if self.columns is not None else 0
+
+    def release_block(self):
+        if self.block is not None:
+            self.columns = None
+            self.block = None
+            self.block_finalizer()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool = None
+            self.pool_finalizer()
+        self.release_block()
+
+    def __getstate__(self):
+        # Pickled (e.g. by save_model) as the plain matrix; the block and the pool belong to this process
+        return {
+            'n_workers': self.n_workers,
+            'n_shards': self.n_shards,
+            'chunk_size': self.chunk_size,
+            'X': self.columns.T.copy() if self.columns is not None else None,
+        }
+
+    def __setstate__(self, state):
+        X = state.pop('X')
+        self.__init__(**state)
+        if X is not None:
+            self.fit(X)
+
+class QuantizedBackend(NeighborBackend):
+    # Brute-force search on a compact copy of the scaled matrix, stored feature-major: 'float32' halves
+    # it, 'int8' keeps one byte per value. An int8 column is coded on its own step; a column that
+    # only takes values on an evenly spaced grid of at most 255 points (scaled integer stats) is
+    # coded without loss, other columns are rounded to 255 levels. Distances are computed from
+    # the codes directly, in float32, one block of rows at a time
+    def __init__(self, precision='int8', chunk_size=64, block_rows=65536):
+        if precision not in ('int8', 'float32'):
+            raise ValueError(f"Unknown precision '{precision}', expected 'int8' or 'float32'")
+        self.name = 'quantized' if precision == 'int8' else precision
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.block_rows = block_rows
+        self.columns = None
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        d = X.shape[1]
+        if self.precision == 'float32':
+            self.offsets, self.steps = np.zeros(d), np.ones(d)
+            self.columns = np.ascontiguousarray(X.T, dtype=np.float32)
+            return self
+        self.offsets, self.steps = np.zeros(d), np.ones(d)
+        self.columns = np.empty((d, len(X)), dtype=np.int8)
+        for feature in range(d):
+            column = X[:, feature]
+            if len(column) == 0:
+                continue
+            values = np.unique(column)
+            low, high = values[0], values[-1]
+            step = (high - low) / 254 if high > low else 1.0
+            if 1 < len(values) <= 255:
+                grid = np.diff(values).min()
+                if (high - low) / grid <= 254.5 and np.allclose(
+                    np.rint((values - low) / grid) * grid, values - low, rtol=0, atol=grid * 1e-6
+                ):
+                    step = grid
+            # Centre the codes so they span -127..127
+            self.offsets[feature] = low + 127 * step
+            self.steps[feature] = step
+            self.columns[feature] = np.clip(np.rint((column - self.offsets[feature]) / step), -127, 127)
+        return self
+
+    def kneighbors(self, X, n_neighbors):
+        # Queries are put on the same code scale but not rounded
+        queries = ((np.asarray(X, dtype=np.float64) - self.offsets) / self.steps).astype(np.float32)
+        weights = (self.steps ** 2).astype(np.float32)
+        n_rows = self.columns.shape[1]
+        n_neighbors = min(n_neighbors, n_rows)
+        distances = np.empty((len(queries), n_neighbors))
+        indices = np.empty((len(queries), n_neighbors), dtype=np.intp)
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = queries[start:start + self.chunk_size]
+            best_squared = np.empty((len(chunk), 0), dtype=np.float32)
+            best_rows = np.empty((len(chunk), 0), dtype=np.intp)
+            for block_start in range(0, n_rows, self.block_rows):
+                block = self.columns[:, block_start:block_start + self.block_rows]
+                squared = np.zeros((len(chunk), block.shape[1]), dtype=np.float32)
+                for feature in range(len(block)):
+                    difference = np.subtract.outer(chunk[:, feature], block[feature].astype(np.float32))
+                    difference *= difference
+                    difference *= weights[feature]
+                    squared += difference
+                block_squared, block_rows = select_k_smallest(squared, n_neighbors)
+                # Merge with the earlier blocks first, so ties keep the lower row
+                best_squared, columns = select_k_smallest(np.hstack([best_squared, block_squared]), n_neighbors)
+                best_rows = np.take_along_axis(np.hstack([best_rows, block_rows + block_start]), columns, axis=1)
+            distances[start:start + self.chunk_size] = np.sqrt(best_squared)
+            indices[start:start + self.chunk_size] = best_rows
+        return distances, indices
+
+    def nbytes(self):
+        return self.columns.nbytes if self.columns is not None else 0
+
+NEIGHBOR_BACKENDS = {
+    'brute': BruteForceBackend,
+    'sklearn': lambda **options: SklearnBackend('auto', **options),
+    'kd_tree': lambda **options: SklearnBackend('kd_tree', **options),
+    'ball_tree': lambda **options: SklearnBackend('ball_tree', **options),
+    'rp_forest': RandomProjectionForestBackend,
+    'sharded': ShardedBruteForceBackend,
+    'quantized': QuantizedBackend,
+    'float32': lambda **options: QuantizedBackend('float32', **options),
+}
+
+def make_neighbor_backend(name, **options):
+    if name not in NEIGHBOR_BACKENDS:
+        raise ValueError(f"Unknown neighbor backend '{name}', expected one of {sorted(NEIGHBOR_BACKENDS)}")
+    return NEIGHBOR_BACKENDS[name](**options)
+
+def evaluate_neighbor_backend(backend, X, k=10, n_queries=1000, seed=0):
+    # recall@k against exact brute force, plus build time and per-query latency percentiles
+    rng = np.random.default_rng(seed)
+    queries = X[rng.choice(len(X), size=min(n_queries, len(X)), replace=False)]
+    _, exact = BruteForceBackend().fit(X).kneighbors(queries, k)
+
+    start = time.perf_counter()
+    backend.fit(X)
+    build_seconds = time.perf_counter() - start
+
+    latencies = np.empty(len(queries))
+    found = np.empty((len(queries), exact.shape[1]), dtype=np.intp)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found[i] = backend.kneighbors(queries[i:i + 1], k)
+        latencies[i] = time.perf_counter() - start
+
+    # Count hits against the exact distance of the k-th neighbor, so ties at the boundary
+    # aren't scored as misses; -1 padding from an approximate backend counts as a miss
+    exact_kth = np.sqrt(((X[exact[:, -1]] - queries) ** 2).sum(axis=1))
+    found_distances = np.sqrt(((X[np.maximum(found, 0)] - queries[:, None, :]) ** 2).sum(axis=2))
+    found_distances[found < 0] = np.inf
+    recall = (found_distances <= exact_kth[:, None] + 1e-9).sum(axis=1) / exact.shape[1]
+    return {
+        'backend': backend.name,
+        'n_rows': len(X),
+        'k': k,
+        'recall_at_k': float(recall.mean()),
+        'build_seconds': build_seconds,
+        'p50_latency_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_latency_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+
+class RecommendationCache:
+    # Bounded LRU cache whose entries are only valid for one model/catalog version; looking up
+    # under a new version drops everything cached for the old one
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+class FeaturePipeline:
+    # The columns KNNRecommender measures similarity on, each with a weight applied after scaling.
+    # Besides the store's stat columns it understands derived features:
+    #   'item_power'        total power of the character's items
+    #   'inventory_size'    number of items
+    #   'rarity:<Rarity>'   items of that rarity ('rarity_counts' expands to every rarity)
+    #   'type:<Type>'       items of that type ('type_counts' expands to every item type)
+    #   'class:<Class>'     one-hot class ('class_onehot' expands to every class)
+    # Inventory-derived columns are computed for the whole store at once, cached per row, and
+    # afterwards recomputed only for rows whose inventory changed
+    GROUPS = {
+        'rarity_counts': [f'rarity:{rarity}' for rarity in RARITIES],
+        'type_counts': [f'type:{item_type}' for item_type in ITEM_TYPES],
+        'class_onehot': [f'class:{char_class}' for char_class in CHARACTER_CLASSES],
+    }
+    INVENTORY_FEATURES = ('item_power', 'inventory_size')
+
+    def __init__(self, game, features=FEATURES, weights=None):
+        # weights maps feature (or group) names to weights; unlisted columns weigh 1
+        weights = weights or {}
+        self.game = game
+        self.columns = []
+        column_weights = []
+        for feature in features:
+            for column in self.GROUPS.get(feature, [feature]):
+                if not (column in CharacterStore.STAT_COLUMNS or column in self.INVENTORY_FEATURES
+                        or column.startswith(('rarity:', 'type:', 'class:'))):
+                    raise ValueError(f"Unknown feature '{column}'")
+                self.columns.append(column)
+                column_weights.append(weights.get(column, weights.get(feature, 1.0)))
+        self.weights = np.array(column_weights, dtype=np.float64)
+        self.inventory_columns = [
+            column for column in self.columns
+            if column in self.INVENTORY_FEATURES or column.startswith(('rarity:', 'type:'))
+        ]
+        # (n_rows, len(inventory_columns)) derived values; None until first needed
+        self.derived = None
+        self.derived_generation = None
+
+    def spec(self):
+        return {'columns': self.columns, 'weights': self.weights.tolist()}
+
+    def inventory_features(self, rows):
+        # Derived inventory columns for the given store rows, vectorized over their item ids
+        store = self.game.character_store
+        compiled = self.game.item_catalog.compile()
+        counts = store.columns['inventory_count'][rows].astype(np.int64)
+        starts = store.columns['inventory_start'][rows]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        item_ids = store.inventory_pool[np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])]
+        owner = np.repeat(np.arange(len(counts)), counts)
+        values = np.zeros((len(counts), len(self.inventory_columns)))
+        for i, column in enumerate(self.inventory_columns):
+            if column == 'inventory_size':
+                values[:, i] = counts
+            elif column == 'item_power':
+                values[:, i] = np.bincount(owner, weights=compiled['power'][item_ids], minlength=len(counts))
+            else:
+                kind, name = column.split(':', 1)
+                names, codes = (
+                    (compiled['rarity_names'], compiled['rarity_code']) if kind == 'rarity'
+                    else (compiled['type_names'], compiled['type_code'])
+                )
+                if name in names:
+                    values[:, i] = np.bincount(owner[codes[item_ids] == names.index(name)], minlength=len(counts))
+        return values
+
+    def refresh(self):
+        # Full recompute the first time, and when the catalog was replaced and ids changed meaning
+        store = self.game.character_store
+        generation = self.game.item_catalog.generation
+        if self.derived is None or self.derived_generation != generation or len(self.derived) != len(store):
+            self.derived = self.inventory_features(slice(0, len(store)))
+            self.derived_generation = generation
+        return self.derived
+
+    def on_store_change(self, event, rows):
+        # Keeps the derived columns in step with the store once they exist
+        if self.derived is None or not self.inventory_columns:
+            return
+        if event == 'add':
+            rows = np.asarray(rows, dtype=np.intp)
+            grown = np.zeros((len(self.game.character_store), len(self.inventory_columns)))
+            grown[:len(self.derived)] = self.derived[:len(grown)]
+            self.derived = grown
+            self.derived[rows] = self.inventory_features(rows)
+        elif event == 'inventory':
+            rows = np.asarray(rows, dtype=np.intp)
+            self.derived[rows] = self.inventory_features(rows)
+        elif event == 'remove':
+            row, last = rows
+            self.derived[row] = self.derived[last]
+            self.derived = self.derived[:last]
+        elif event == 'clear':
+            self.derived = None
+
+    def matrix(self, rows=None):
+        # (n, len(columns)) unscaled feature matrix for store rows (all rows when None)
+        store = self.game.character_store
+        if rows is None:
+            rows = slice(0, len(store))
+        derived = self.refresh()[rows] if self.inventory_columns else None
+        codes = store.columns['class_code'][rows]
+        n_rows = len(codes)
+        X = np.empty((n_rows, len(self.columns)))
+        for i, column in enumerate(self.columns):
+            if column in CharacterStore.STAT_COLUMNS:
+                X[:, i] = store.columns[column][rows]
+            elif column.startswith('class:'):
+                X[:, i] = codes == store.class_codes.get(column[len('class:'):], -1)
+            else:
+                X[:, i] = derived[:, self.inventory_columns.index(column)]
+        return X
+
+    def character_vector(self, character):
+        # Unscaled features of a character outside the store, computed from its attributes
+        items = character.inventory or []
+        vector = []
+        for column in self.columns:
+            if column in CharacterStore.STAT_COLUMNS:
+                vector.append(getattr(character, column))
+            elif column == 'item_power':
+                vector.append(sum(item.power for item in items))
+            elif column == 'inventory_size':
+                vector.append(len(items))
+            else:
+                kind, name = column.split(':', 1)
+                attribute = {'rarity': 'rarity', 'type': 'item_type'}.get(kind)
+                if attribute is None:
+                    vector.append(character.char_class == name)
+                else:
+                    vector.append(sum(getattr(item, attribute) == name for item in items))
+        return vector
+
+    def for_characters(self, characters):
+        store = self.game.character_store
+        X = np.empty((len(characters), len(self.columns)))
+        stored = [i for i, character in enumerate(characters) if character._store is store]
+        if stored:
+            X[stored] = self.matrix(np.array([characters[i]._row for i in stored], dtype=np.intp))
+        for i, character in enumerate(characters):
+            if character._store is not store:
+                X[i] = self.character_vector(character)
+        return X
+
+    def matrix_from_records(self, records):
+        # Feature rows from plain dicts (e.g. request payloads) keyed by column name; a 'class'
+        # key fills the one-hot columns and anything missing counts as 0
+        return np.array([
+            [
+                record.get('class') == column[len('class:'):] if column.startswith('class:') else record.get(column, 0)
+                for column in self.columns
+            ]
+            for record in records
+        ], dtype=np.float64).reshape(len(records), len(self.columns))
+
+class KNNRecommender:
+    def __init__(self, game, backend='sklearn', backend_options=None, staleness_threshold=0.1, min_rebuild_rows=64,
+                 max_stale_rows=16384, cache_size=10000, features=FEATURES, feature_weights=None):
+        self.game = game
+        self.instrumentation = game.instrumentation
+        self.features = FeaturePipeline(game, features, feature_weights)
+        # Created by fit() or load_model()
+        self.scaler = None
+        self.knn_model = None
+        self.backend = backend
+        self.backend_options = backend_options or {}
+        self.n_neighbors = 5
+        # Rows added, edited or removed since the last rebuild are answered by a brute-force
+        # pass over the store; the index is rebuilt once they exceed this share of the index,
+        # or max_stale_rows whatever the index size, since every query scans them all
+        self.staleness_threshold = staleness_threshold
+        self.min_rebuild_rows = min_rebuild_rows
+        self.max_stale_rows = max_stale_rows
+        self.model_version = 0
+        # Bumped only when the index is replaced (fit, load_model, clear), unlike model_version
+        self.index_version = 0
+        self.n_indexed = 0
+        self.stale_rows = set()
+        game.character_store.subscribe(self.on_store_change)
+        # Many characters share a stat vector, so results are cached per vector rather than per
+        # character; the neighbor cache follows model_version and the item cache item_database_version
+        self.neighbor_cache = RecommendationCache(cache_size)
+        self.item_cache = RecommendationCache(cache_size)
+        self.prepared_data = None
+        self.prepared_data_version = None
+        self.scaled_data = None
+        self.scaled_data_key = None
+        self.ownership = None
+        self.ownership_key = None
+        self.partitions = None
+        self.partitions_key = None
+        self.pending_columns = None
+        self.pending_columns_key = None
+
+    @instrumented('recommender.prepare_data', rows=first_length)
+    def prepare_data(self):
+        # The frame is shared between calls until the store changes; callers must not modify it
+        store = self.game.character_store
+        # Derived item features change meaning when the catalog is replaced
+        version = (store.version, self.game.item_catalog.generation)
+        if self.prepared_data_version != version:
+            self.prepared_data = (self.feature_matrix(), store.to_frame())
+            self.prepared_data_version = version
+        return self.prepared_data
+
+    def scaled_features(self):
+        # Scaled feature matrix of the whole store, shared until the store or the scaler changes
+        key = (self.game.character_store.version, self.model_version)
+        if self.scaled_data_key != key:
+            X, _ = self.prepare_data()
+            self.scaled_data = self.transform(X)
+            self.scaled_data_key = key
+        return self.scaled_data
+
+    def feature_matrix(self, rows=None):
+        # Unscaled store features in self.features.columns order; raw query matrices use the same order
+        return self.features.matrix(rows)
+
+    def transform(self, X):
+        # Scale, then weight each column
+        X_scaled = self.scaler.transform(X)
+        if np.any(self.features.weights != 1):
+            X_scaled *= self.features.weights
+        return X_scaled
+
+    def set_features(self, features, weights=None):
+        # Switches the feature pipeline; the next query refits on the new columns
+        self.features = FeaturePipeline(self.game, features, weights)
+        self.prepared_data_version = None
+        self.knn_model = None
+        self.scaler = None
+        self.model_version += 1
+
+    @instrumented('recommender.fit', rows=lambda recommender, _: recommender.n_indexed)
+    def fit(self, n_neighbors=5):
+        from sklearn.preprocessing import StandardScaler
+
+        X = self.feature_matrix()
+        self.scaler = StandardScaler().fit(X)
+        X_scaled = self.transform(X)
+        self.knn_model = make_neighbor_backend(self.backend, **self.backend_options)
+        self.knn_model.fit(X_scaled)
+        self.n_neighbors = n_neighbors
+        self.n_indexed = len(X)
+        self.stale_rows = set()
+        self.model_version += 1
+        self.index_version += 1
+
+    def store_fingerprint(self):
+        X = self.feature_matrix()
+        return hashlib.blake2b(X.tobytes(), digest_size=16).hexdigest()
+
+    def save_model(self, directory):
+        if self.knn_model is None:
+            self.fit(self.n_neighbors)
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            'format_version': 1,
+            'features': self.features.columns,
+            'feature_weights': self.features.weights.tolist(),
+            'backend': self.backend,
+            'backend_options': self.backend_options,
+            'n_neighbors': self.n_neighbors,
+            'n_indexed': self.n_indexed,
+            'stale_rows': sorted(self.stale_rows),
+            'model_version': self.model_version,
+            'n_characters': len(self.game.character_store),
+            'store_fingerprint': self.store_fingerprint(),
+        }
+        # A saved meta.json vouches for the files next to it, so it is removed before they are
+        # replaced and written back last: a crash part way leaves no model rather than an old
+        # meta.json beside a new index. Files go under temporary names first, as in save_columns
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        scaler_path = os.path.join(directory, 'scaler.npz')
+        with open(f'{scaler_path}.tmp', 'wb') as f:
+            np.savez(
+                f, mean=self.scaler.mean_, scale=self.scaler.scale_, var=self.scaler.var_,
+                n_samples_seen=self.scaler.n_samples_seen_
+            )
+        index_path = os.path.join(directory, 'index.pkl')
+        with open(f'{index_path}.tmp', 'wb') as f:
+            pickle.dump(self.knn_model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(f'{meta_path}.tmp', 'w') as f:
+            json.dump(meta, f, default=int)
+        for path in (scaler_path, index_path, meta_path):
+            os.replace(f'{path}.tmp', path)
+        print(f"Recommender model saved to {directory}")
+
+    def load_model(self, directory):
+        # Returns False without touching the current model if the saved one doesn't match the
+        # feature schema, backend or contents of the character store. The index is unpickled,
+        # so only load models this deployment wrote itself
+        meta_path = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_path):
+            print(f"No saved recommender model found at {directory}")
+            return False
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        expected = {
+            'format_version': 1,
+            'features': self.features.columns,
+            'feature_weights': self.features.weights.tolist(),
+            'backend': self.backend,
+            'backend_options': self.backend_options,
+            'n_characters': len(self.game.character_store),
+        }
+        mismatched = [key for key, value in expected.items() if meta.get(key) != value]
+        if not mismatched and meta['store_fingerprint'] != self.store_fingerprint():
+            mismatched.append('store_fingerprint')
+        if mismatched:
+            print(f"Saved recommender model at {directory} is out of date ({', '.join(mismatched)})")
+            return False
+
+        from sklearn.preprocessing import StandardScaler
+
+        arrays = np.load(os.path.join(directory, 'scaler.npz'))
+        scaler = StandardScaler()
+        scaler.mean_, scaler.scale_, scaler.var_ = arrays['mean'], arrays['scale'], arrays['var']
+        scaler.n_samples_seen_ = arrays['n_samples_seen']
+        scaler.n_features_in_ = len(self.features.columns)
+        with open(os.path.join(directory, 'index.pkl'), 'rb') as f:
+            self.knn_model = pickle.load(f)
+        self.scaler = scaler
+        self.n_neighbors = meta['n_neighbors']
+        self.n_indexed = meta['n_indexed']
+        self.stale_rows = set(meta['stale_rows'])
+        self.model_version = max(self.model_version + 1, meta['model_version'])
+        self.index_version += 1
+        print(f"Recommender model loaded from {directory}")
+        return True
+
+    def warm_start(self, directory, n_neighbors=5):
+        # Reuse the saved model when it still matches the character store, otherwise refit
+        # and save the new one for the next start
+        if not self.load_model(directory):
+            self.fit(n_neighbors)
+            self.save_model(directory)
+
+    def on_store_change(self, event, rows):
+        # The derived feature columns must be current before a rebuild can read them
+        self.features.on_store_change(event, rows)
+        if event == 'add':
+            # Rows past n_indexed are picked up as pending automatically; rows below it were
+            # vacated by a removal and re-used, so the indexed copy no longer matches
+            self.mark_stale([row for row in rows if row < self.n_indexed])
+        elif event == 'update':
+            self.mark_stale(rows)
+        elif event == 'inventory':
+            # Only moves a row when its features are derived from the inventory
+            if self.features.inventory_columns:
+                self.mark_stale(rows)
+        elif event == 'remove':
+            # rows is [row] or [row, moved_from] when the last row was swapped into the gap
+            self.mark_stale(rows)
+        elif event == 'clear':
+            self.knn_model = None
+            self.n_indexed = 0
+            self.stale_rows = set()
+            self.model_version += 1
+            self.index_version += 1
+
+    # The index follows the character store, so these go through the game; characters added,
+    # edited or removed there directly (RPGInventory.add_character, attribute assignment,
+    # RPGInventory.remove_character) reach the index the same way
+    def add_characters(self, characters):
+        self.game.add_characters(characters)
+
+    def update_character(self, character, **attributes):
+        if character._store is not self.game.character_store:
+            raise ValueError(f"{character.name} is not in this game's character store")
+        for attribute, value in attributes.items():
+            setattr(character, attribute, value)
+
+    def remove_character(self, character):
+        if character._store is not self.game.character_store:
+            raise ValueError(f"{character.name} is not in this game's character store")
+        return self.game.remove_character(character)
+
+    def mark_stale(self, rows):
+        self.model_version += 1
+        if self.knn_model is None:
+            return
+        self.stale_rows.update(row for row in rows if row < self.n_indexed)
+        limit = min(max(self.min_rebuild_rows, self.staleness_threshold * self.n_indexed), self.max_stale_rows)
+        if self.staleness() > limit:
+            self.fit(self.n_neighbors)
+
+    def staleness(self):
+        return len(self.stale_rows) + max(0, len(self.game.character_store) - self.n_indexed)
+
+    def pending_rows(self):
+        size = len(self.game.character_store)
+        stale = sorted(row for row in self.stale_rows if row < size)
+        return np.concatenate([
+            np.array(stale, dtype=np.intp),
+            np.arange(self.n_indexed, max(size, self.n_indexed), dtype=np.intp)
+        ])
+
+    @instrumented('recommender.kneighbors', rows=first_length)
+    def kneighbors(self, X_scaled, n_neighbors):
+        store = self.game.character_store
+        n_neighbors = min(n_neighbors, len(store))
+        if not self.stale_rows and len(store) <= self.n_indexed:
+            distances, indices = self.knn_model.kneighbors(X_scaled, min(self.n_indexed, n_neighbors))
+            return distances[:, :n_neighbors], indices[:, :n_neighbors]
+
+        # Skip hits whose indexed copy is stale and merge in an exact search over the pending
+        # rows, scaled with the scaler from the last rebuild. Index hits come first, so ties
+        # keep them ahead of pending rows
+        distances, indices = self.indexed_neighbors(X_scaled, n_neighbors)
+        pending, pending_columns = self.pending_features()
+        if len(pending):
+            chunk_size = max(1, min(256, 2 ** 24 // len(pending)))
+            pending_squared, positions = search_columns(pending_columns, X_scaled, n_neighbors, chunk_size)
+            distances = np.hstack([distances, np.sqrt(pending_squared)])
+            indices = np.hstack([indices, pending[positions]])
+        distances, columns = select_k_smallest(distances, n_neighbors)
+        return distances, np.take_along_axis(indices, columns, axis=1)
+
+    def indexed_neighbors(self, X_scaled, n_neighbors, max_block_values=2 ** 22):
+        # The n_neighbors nearest indexed rows that are not stale, padded with inf / -1. The
+        # index is asked for a small margin past n_neighbors; only queries that lost too many
+        # hits to stale rows are asked again, with the fetch doubled each round. Queries go in
+        # chunks so a (chunk, fetch) block stays within max_block_values
+        limit = min(self.n_indexed, n_neighbors + len(self.stale_rows))
+        distances = np.full((len(X_scaled), n_neighbors), np.inf)
+        indices = np.full((len(X_scaled), n_neighbors), -1, dtype=np.intp)
+        if limit == 0:
+            return distances, indices
+        # One extra slot so the -1 padding of approximate backends reads as not stale
+        stale = np.zeros(self.n_indexed + 1, dtype=bool)
+        stale[[row for row in self.stale_rows if row < self.n_indexed]] = True
+        queries = np.arange(len(X_scaled))
+        n_fetch = min(limit, n_neighbors + min(len(self.stale_rows), max(n_neighbors, 8)))
+        while len(queries):
+            chunk_size = max(1, max_block_values // n_fetch)
+            retry = []
+            for start in range(0, len(queries), chunk_size):
+                chunk = queries[start:start + chunk_size]
+                found_distances, found_indices = self.knn_model.kneighbors(X_scaled[chunk], n_fetch)
+                valid = (found_indices >= 0) & ~stale[found_indices]
+                # Move the valid hits to the front, keeping the index's order
+                order = np.argsort(~valid, axis=1, kind='stable')[:, :n_neighbors]
+                kept = np.take_along_axis(valid, order, axis=1)
+                width = order.shape[1]
+                distances[chunk, :width] = np.where(kept, np.take_along_axis(found_distances, order, axis=1), np.inf)
+                indices[chunk, :width] = np.where(kept, np.take_along_axis(found_indices, order, axis=1), -1)
+                # More hits can only exist if the index filled every slot it was asked for
+                if n_fetch < limit:
+                    short = (valid.sum(axis=1) < n_neighbors) & (found_indices[:, -1] >= 0)
+                    retry.append(chunk[short])
+            queries = np.concatenate(retry) if retry else queries[:0]
+            n_fetch = min(limit, n_fetch * 2)
+        return distances, indices
+
+    def pending_features(self):
+        # Pending rows and their scaled features, feature-major, shared until the store or model changes
+        key = (self.game.character_store.version, self.model_version)
+        if self.pending_columns_key != key:
+            pending = self.pending_rows()
+            if len(pending):
+                columns = np.ascontiguousarray(self.transform(self.feature_matrix(pending)).T)
+            else:
+                columns = np.zeros((len(self.features.columns), 0))
+            self.pending_columns = (pending, columns)
+            self.pending_columns_key = key
+        return self.pending_columns
+
+    @instrumented('recommender.get_recommendations')
+    def get_recommendations(self, character, n_recommendations=5):
+        if self.knn_model is None:
+            self.fit()
+
+        features = self.features.for_characters([character])
+        key = (tuple(features[0].tolist()), n_recommendations)
+        cached = self.neighbor_cache.get(key, self.model_version)
+        if cached is None:
+            character_scaled, _ = self.scale_queries(features)
+            # Fetch one extra so the character itself can be dropped whatever its row is
+            distances, indices = self.kneighbors(character_scaled, n_recommendations + 1)
+            cached = (character_scaled, distances, indices)
+            self.neighbor_cache.put(key, cached)
+        character_scaled, distances, indices = cached
+        own_row = character._row if character._store is self.game.character_store else -1
+        distances, indices = self.drop_excluded(distances, indices, np.array([own_row]))
+        # Only the neighbor rows are read from the store; the whole-population frame and scaled
+        # matrix are left to the visualization
+        recommendations = self.game.character_store.to_frame(indices[0])
+        return recommendations, character_scaled, indices
+
+    @instrumented('recommender.get_recommendations_batch', rows=first_length)
+    def get_recommendations_batch(self, characters_or_matrix, k=5, exclude_rows=None):
+        # Accepts Character objects or a raw (n, len(self.features.columns)) feature matrix and
+        # returns (distances, indices) arrays of shape (n, k), indices being character store rows
+        if self.knn_model is None:
+            self.fit()
+
+        queries_scaled, own_rows = self.scale_queries(characters_or_matrix)
+        return self.search(queries_scaled, k, own_rows if exclude_rows is None else exclude_rows)
+
+    @instrumented('recommender.scale_queries', rows=first_length)
+    def scale_queries(self, characters_or_matrix):
+        if isinstance(characters_or_matrix, np.ndarray):
+            return self.transform(characters_or_matrix.astype(np.float64, copy=False)), None
+
+        # Characters already in the store must not be returned as their own neighbor
+        store = self.game.character_store
+        characters = list(characters_or_matrix)
+        own_rows = np.array([character._row if character._store is store else -1 for character in characters])
+        return self.transform(self.features.for_characters(characters)), own_rows
+
+    def search(self, queries_scaled, k, exclude_rows=None):
+        if exclude_rows is None or not np.any(np.asarray(exclude_rows) >= 0):
+            return self.kneighbors(queries_scaled, k)
+
+        distances, indices = self.kneighbors(queries_scaled, k + 1)
+        return self.drop_excluded(distances, indices, exclude_rows)
+
+    def drop_excluded(self, distances, indices, exclude_rows):
+        # Takes k + 1 hits per query and drops the excluded row, or the furthest hit if it wasn't found.
+        # A population of one leaves (n, 0) arrays
+        if indices.shape[1] == 0:
+            return distances, indices
+        keep = indices != np.asarray(exclude_rows)[:, None]
+        keep[keep.all(axis=1), -1] = False
+        n_kept = indices.shape[1] - 1
+        return distances[keep].reshape(len(indices), n_kept), indices[keep].reshape(len(indices), n_kept)
+
+    def evaluate_backends(self, backends=('brute', 'kd_tree', 'ball_tree', 'rp_forest', 'quantized'), k=10,
+                          n_queries=1000):
+        import pandas as pd
+        from sklearn.preprocessing import StandardScaler
+
+        X_scaled = StandardScaler().fit_transform(self.feature_matrix()) * self.features.weights
+        results = []
+        for backend in backends:
+            if isinstance(backend, str):
+                backend = make_neighbor_backend(backend)
+            results.append(evaluate_neighbor_backend(backend, X_scaled, k, n_queries))
+        return pd.DataFrame(results)
+
+    def memory_report(self):
+        # Bytes held for recommendations, by component: the store columns and inventory pool the
+        # features are read from, the derived feature cache, the index and whichever cached
+        # matrices have been built. Character names and materialized Character objects are not
+        # counted
+        store = self.game.character_store
+        report = {
+            'store_columns': sum(values.nbytes for values in store.columns.values()),
+            'inventory_pool': store.inventory_pool.nbytes,
+            'derived_features': self.features.derived.nbytes if self.features.derived is not None else 0,
+            'index': self.knn_model.nbytes() if self.knn_model is not None else 0,
+            'prepared_data': 0,
+            'scaled_data': self.scaled_data.nbytes if self.scaled_data is not None else 0,
+            'partitions': 0,
+            'ownership': 0,
+        }
+        if self.prepared_data is not None:
+            X, df = self.prepared_data
+            report['prepared_data'] = X.nbytes + int(df.memory_usage(index=False).sum())
+        if self.partitions is not None:
+            report['partitions'] = sum(
+                value.nbytes for value in self.partitions.values() if isinstance(value, np.ndarray)
+            )
+        if self.ownership is not None:
+            report['ownership'] = self.ownership.data.nbytes + self.ownership.indices.nbytes + self.ownership.indptr.nbytes
+        report['total'] = sum(report.values())
+        report['n_characters'] = len(store)
+        report['bytes_per_million_characters'] = report['total'] / len(store) * 1e6 if len(store) else None
+        return report
+
+    def calculate_item_similarity(self, character, item):
+        # Calculate similarity based on how well item required stats match character stats
+        stat_diffs = {
+            'strength': abs(character.strength - item.required_stats.get('strength', 0)),
+            'intelligence': abs(character.intelligence - item.required_stats.get('intelligence', 0)),
+            'dexterity': abs(character.dexterity - item.required_stats.get('dexterity', 0))
+        }
+        similarity_score = 100 - sum(stat_diffs.values())  # Higher score = more similar
+        return max(0, similarity_score)  # Ensure it's not negative
+
+    def compile_item_catalog(self):
+        # Dense (n_items, len(ITEM_STATS)) required-stats matrix, rebuilt only when the catalog changes
+        return self.game.item_catalog.compile()['required_stats']
+
+    @instrumented('recommender.score_items', rows=result_length)
+    def score_items(self, character_stats):
+        # Vectorized calculate_item_similarity for a (n_characters, len(ITEM_STATS)) block
+        item_stats = self.compile_item_catalog()
+        # One stat at a time, so the only temporaries are (n_characters, n_items)
+        distances = np.zeros((len(character_stats), len(item_stats)), dtype=np.int32)
+        for stat in range(item_stats.shape[1]):
+            difference = np.subtract.outer(character_stats[:, stat], item_stats[:, stat]).astype(np.int32, copy=False)
+            np.abs(difference, out=difference)
+            distances += difference
+        return np.maximum(0, 100 - distances)
+
+    @instrumented('recommender.recommend_items_for_character')
+    def recommend_items_for_character(self, character, n_recommendations=5):
+        key = (tuple(int(getattr(character, stat)) for stat in ITEM_STATS), n_recommendations)
+        cached = self.item_cache.get(key, self.game.item_database_version)
+        if cached is None:
+            item_indices, scores = self.recommend_items_batch([character], n_recommendations)
+            cached = (item_indices[0].tolist(), scores[0].tolist())
+            self.item_cache.put(key, cached)
+        item_ids, scores = cached
+        return list(zip(self.game.item_catalog.items_for_ids(item_ids), scores))
+
+    def cache_stats(self):
+        return {'neighbors': self.neighbor_cache.stats(), 'items': self.item_cache.stats()}
+
+    def partition_index(self):
+        # The indexed rows sorted by (class, level), so the players of one class within a level
+        # range form a single contiguous slice; the scaled features are kept in the same order,
+        # feature-major. Maintained alongside the main index: rebuilt only when that is, while
+        # edits in between are handled like there, by skipping stale rows and searching the
+        # pending ones directly
+        store = self.game.character_store
+        if self.partitions_key != self.index_version:
+            rows = np.arange(min(self.n_indexed, len(store)))
+            levels = store.columns['level'][rows].astype(np.int64)
+            width = int(levels.max()) + 1 if len(levels) else 1
+            partition_keys = store.columns['class_code'][rows].astype(np.int64) * width + np.maximum(levels, 0)
+            order = np.argsort(partition_keys, kind='stable')
+            self.partitions = {
+                'order': order,
+                'keys': partition_keys[order],
+                'width': width,
+                'columns': np.ascontiguousarray(self.transform(self.feature_matrix(order)).T),
+            }
+            self.partitions_key = self.index_version
+        return self.partitions
+
+    def partition_positions(self, class_code, min_level, max_level):
+        # Positions in partition order of the rows of class_code (-1: any class) within the levels
+        partitions = self.partition_index()
+        width = partitions['width']
+        min_level, max_level = max(int(min_level), 0), min(int(max_level), width - 1)
+        codes = range(len(self.game.character_store.class_names)) if class_code == -1 else [class_code]
+        if min_level > max_level or class_code < -1:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate([np.zeros(0, dtype=np.intp)] + [
+            np.arange(
+                np.searchsorted(partitions['keys'], code * width + min_level, 'left'),
+                np.searchsorted(partitions['keys'], code * width + max_level, 'right')
+            )
+            for code in codes
+        ])
+
+    @instrumented('recommender.filtered_neighbors_batch', rows=first_length)
+    def filtered_neighbors_batch(self, characters_or_matrix, k=5, char_class='same', level_band=5, min_level=None,
+                                 max_level=None, owned_items=None, exclude_rows=None):
+        # Exact KNN restricted to players of a class within a level window who own every item in
+        # owned_items (Items or catalog ids). Only the matching partitions are searched, so each
+        # query gets k valid neighbors whenever that many players match; shorter rows are padded
+        # with inf / -1.
+        # char_class: 'same' (each Character's own class), None (any), a class name, or one name
+        # per query. The level window is level +/- level_band (None: any level), narrowed to
+        # [min_level, max_level] when given
+        if self.knn_model is None:
+            self.fit()
+        store = self.game.character_store
+        is_matrix = isinstance(characters_or_matrix, np.ndarray)
+        if not is_matrix:
+            characters_or_matrix = list(characters_or_matrix)
+        queries_scaled, own_rows = self.scale_queries(characters_or_matrix)
+        n_queries = len(queries_scaled)
+        if exclude_rows is None:
+            exclude_rows = own_rows if own_rows is not None else np.full(n_queries, -1)
+        exclude_rows = np.asarray(exclude_rows)
+
+        if char_class == 'same':
+            if is_matrix:
+                raise ValueError("char_class='same' needs Character queries; pass class names with a feature matrix")
+            class_names = [character.char_class for character in characters_or_matrix]
+        elif char_class is None or isinstance(char_class, str):
+            class_names = [char_class] * n_queries
+        else:
+            class_names = list(char_class)
+        # -1 matches any class, -2 a class no player has
+        class_codes = np.array([
+            -1 if name is None else store.class_codes.get(name, -2) for name in class_names
+        ], dtype=np.int64)
+
+        if is_matrix:
+            if 'level' not in self.features.columns:
+                raise ValueError("Feature matrix queries need a 'level' column for level filtering")
+            levels = characters_or_matrix[:, self.features.columns.index('level')].astype(np.int64)
+        else:
+            levels = np.array([character.level for character in characters_or_matrix], dtype=np.int64)
+        unbounded = np.iinfo(np.int64).max // 2
+        low = levels - level_band if level_band is not None else np.full(n_queries, 0)
+        high = levels + level_band if level_band is not None else np.full(n_queries, unbounded)
+        if min_level is not None:
+            low = np.maximum(low, min_level)
+        if max_level is not None:
+            high = np.minimum(high, max_level)
+
+        partitions = self.partition_index()
+        owners = None
+        if owned_items:
+            item_ids = [item if isinstance(item, (int, np.integer)) else self.game.item_catalog.ids.get(item.name, -1)
+                        for item in owned_items]
+            if min(item_ids) < 0:
+                owners = np.zeros(len(store), dtype=bool)
+            else:
+                owners = (self.ownership_matrix()[:, item_ids] > 0).sum(axis=1).A1 == len(item_ids)
+        # Rows edited since the partitions were built are searched from their current values instead
+        stale = None
+        if self.stale_rows:
+            stale = np.zeros(len(partitions['order']), dtype=bool)
+            stale[[row for row in self.stale_rows if row < len(stale)]] = True
+        pending, pending_columns = self.pending_features()
+        pending_codes = store.columns['class_code'][pending].astype(np.int64)
+        pending_levels = store.columns['level'][pending].astype(np.int64)
+
+        distances = np.full((n_queries, k), np.inf)
+        indices = np.full((n_queries, k), -1, dtype=np.intp)
+        # Queries with the same class and level window share one candidate set
+        groups, group_of = np.unique(np.stack([class_codes, low, high], axis=1), axis=0, return_inverse=True)
+        group_of = group_of.ravel()
+        query_order = np.argsort(group_of, kind='stable')
+        for group, queries in zip(groups, np.split(query_order, np.cumsum(np.bincount(group_of, minlength=len(groups)))[:-1])):
+            class_code, group_low, group_high = group
+            positions = self.partition_positions(class_code, group_low, group_high)
+            if stale is not None:
+                positions = positions[~stale[partitions['order'][positions]]]
+            candidates = partitions['order'][positions]
+            if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+                # A single contiguous run (one class, no stale rows) is searched in place
+                columns = partitions['columns'][:, positions[0]:positions[-1] + 1]
+            else:
+                columns = partitions['columns'][:, positions]
+            matching = (pending_levels >= group_low) & (pending_levels <= group_high)
+            if class_code != -1:
+                matching &= pending_codes == class_code
+            if matching.any():
+                candidates = np.concatenate([candidates, pending[matching]])
+                columns = np.hstack([columns, pending_columns[:, matching]])
+            if owners is not None:
+                owned = owners[candidates]
+                candidates, columns = candidates[owned], columns[:, owned]
+            if len(candidates) == 0:
+                continue
+            excluded = exclude_rows[queries]
+            # One extra hit so a query's own row can be dropped
+            n_fetch = k + 1 if np.any(excluded >= 0) else k
+            squared, local = search_columns(columns, queries_scaled[queries], n_fetch)
+            rows = candidates[local]
+            keep = rows != excluded[:, None]
+            # Shift kept hits left, in distance order, and cut to k
+            shift = np.argsort(~keep, axis=1, kind='stable')[:, :k]
+            kept = np.take_along_axis(keep, shift, axis=1)
+            width = shift.shape[1]
+            distances[queries, :width] = np.where(kept, np.sqrt(np.take_along_axis(squared, shift, axis=1)), np.inf)
+            indices[queries, :width] = np.where(kept, np.take_along_axis(rows, shift, axis=1), -1)
+        return distances, indices
+
+    def ownership_matrix(self):
+        # Sparse (n_characters, n_items) CSR matrix of how many copies of each item a character
+        # owns, rebuilt only when the store or the catalog changes
+        from scipy import sparse
+
+        store = self.game.character_store
+        key = (store.version, self.game.item_database_version)
+        if self.ownership_key != key:
+            offsets, item_ids = store.inventory_csr()
+            self.ownership = sparse.csr_matrix(
+                (np.ones(len(item_ids), dtype=np.float32), item_ids, offsets),
+                shape=(len(store), len(self.game.item_catalog))
+            )
+            self.ownership.sum_duplicates()
+            self.ownership_key = key
+        return self.ownership
+
+    def owned_matrix(self, characters_or_matrix, query_rows):
+        # (n_queries, n_items) CSR of what each query already owns: store rows read the ownership
+        # matrix, detached characters their own inventory, raw stat vectors own nothing
+        from scipy import sparse
+
+        ownership = self.ownership_matrix()
+        if isinstance(characters_or_matrix, np.ndarray):
+            inventories = [[] for _ in range(len(query_rows))]
+        else:
+            ids = self.game.item_catalog.ids
+            inventories = [
+                [ids[item.name] for item in character.inventory if item.name in ids] if row < 0 else []
+                for character, row in zip(characters_or_matrix, query_rows)
+            ]
+        detached = sparse.csr_matrix(
+            (np.ones(sum(map(len, inventories)), dtype=np.float32),
+             np.array([item_id for inventory in inventories for item_id in inventory], dtype=np.intp),
+             np.concatenate([[0], np.cumsum([len(inventory) for inventory in inventories])])),
+            shape=(len(query_rows), ownership.shape[1])
+        )
+        stored = sparse.diags((query_rows >= 0).astype(np.float32)) @ ownership[np.maximum(query_rows, 0)]
+        return (stored + detached).tocsr()
+
+    @instrumented('recommender.collaborative_items_batch', rows=first_length)
+    def collaborative_items_batch(self, characters_or_matrix=None, k=5, n_neighbors=10, weighting='uniform',
+                                  exclude_rows=None, chunk_size=65536):
+        # Scores items by how often the query's KNN neighbors own them (weighted by 1 / distance
+        # with weighting='distance') and returns (item_ids, scores) arrays of shape (n, k), best
+        # first, leaving out items the query already owns. Short rows are padded with -1 / 0.
+        # Character objects and exclude_rows say which store row a query is; None scores the
+        # whole store in row order
+        from scipy import sparse
+
+        if weighting not in ('uniform', 'distance'):
+            raise ValueError(f"Unknown weighting '{weighting}', expected 'uniform' or 'distance'")
+        if self.knn_model is None:
+            self.fit()
+        if characters_or_matrix is None:
+            characters_or_matrix = self.feature_matrix()
+            exclude_rows = np.arange(len(characters_or_matrix))
+        elif not isinstance(characters_or_matrix, np.ndarray):
+            characters_or_matrix = list(characters_or_matrix)
+
+        queries_scaled, own_rows = self.scale_queries(characters_or_matrix)
+        if exclude_rows is None:
+            exclude_rows = own_rows if own_rows is not None else np.full(len(queries_scaled), -1)
+        exclude_rows = np.asarray(exclude_rows)
+        ownership = self.ownership_matrix()
+
+        item_ids = np.full((len(queries_scaled), k), -1, dtype=np.intp)
+        scores = np.zeros((len(queries_scaled), k))
+        for start in range(0, len(queries_scaled), chunk_size):
+            stop = min(start + chunk_size, len(queries_scaled))
+            rows = exclude_rows[start:stop]
+            distances, indices = self.search(queries_scaled[start:stop], n_neighbors, rows)
+            weights = np.ones_like(distances) if weighting == 'uniform' else 1 / (distances + 1e-9)
+            # Padding (-1) past the population counts for nothing
+            found = indices >= 0
+            weights = np.where(found, weights, 0)
+            # Sparse (chunk, n_characters) neighbor weights times ownership gives item scores
+            neighbor_weights = sparse.csr_matrix(
+                (weights.ravel(), np.where(found, indices, 0).ravel(), np.arange(stop - start + 1) * indices.shape[1]),
+                shape=(stop - start, ownership.shape[0])
+            )
+            chunk_scores = (neighbor_weights @ ownership).tocsr()
+            owned = self.owned_matrix(characters_or_matrix[start:stop], rows)
+            chunk_scores = chunk_scores - chunk_scores.multiply(owned > 0)
+            chunk_scores.eliminate_zeros()
+
+            # Per-row top k over the nonzeros: sort by row, then score descending, then item id
+            query_of = np.repeat(np.arange(stop - start), np.diff(chunk_scores.indptr))
+            order = np.lexsort((chunk_scores.indices, -chunk_scores.data, query_of))
+            rank = np.arange(len(order)) - chunk_scores.indptr[query_of[order]]
+            top = order[rank < k]
+            item_ids[start + query_of[top], rank[rank < k]] = chunk_scores.indices[top]
+            scores[start + query_of[top], rank[rank < k]] = chunk_scores.data[top]
+        return item_ids, scores
+
+    def recommend_items_collaborative(self, character, n_recommendations=5, n_neighbors=10, weighting='uniform'):
+        item_ids, scores = self.collaborative_items_batch([character], n_recommendations, n_neighbors, weighting)
+        found = item_ids[0] >= 0
+        return list(zip(self.game.item_catalog.items_for_ids(item_ids[0][found].tolist()), scores[0][found].tolist()))
+
+    @instrumented('recommender.recommend_items_batch', rows=first_length)
+    def recommend_items_batch(self, characters_or_matrix, k=5, chunk_size=4096, max_block_values=2 ** 22):
+        # Accepts Character objects or a raw (n, len(self.features.columns)) feature matrix and
+        # returns (item_indices, scores) arrays of shape (n, k), best item first. Each chunk of
+        # characters is sized so a (chunk, n_items) score block stays within max_block_values
+        if isinstance(characters_or_matrix, np.ndarray):
+            missing = [stat for stat in ITEM_STATS if stat not in self.features.columns]
+            if missing:
+                raise ValueError(f"Feature matrix queries need {missing} columns for item scoring")
+            columns = [self.features.columns.index(stat) for stat in ITEM_STATS]
+            character_stats = characters_or_matrix[:, columns].astype(np.int32)
+        else:
+            character_stats = np.array(
+                [[getattr(character, stat) for stat in ITEM_STATS] for character in characters_or_matrix],
+                dtype=np.int32
+            ).reshape(-1, len(ITEM_STATS))
+
+        n_items = len(self.compile_item_catalog())
+        k = min(k, n_items)
+        chunk_size = max(1, min(chunk_size, max_block_values // max(n_items, 1)))
+        item_indices = np.empty((len(character_stats), k), dtype=np.intp)
+        scores = np.empty((len(character_stats), k), dtype=np.int32)
+        # Break score ties on catalog position so results match a stable sort of the catalog
+        tie_break = np.arange(n_items - 1, -1, -1, dtype=np.int64)
+        for start in range(0, len(character_stats), chunk_size):
+            chunk_scores = self.score_items(character_stats[start:start + chunk_size])
+            keys = chunk_scores.astype(np.int64) * n_items + tie_break
+            if k < n_items:
+                top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(n_items), keys.shape)
+            order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            item_indices[start:start + chunk_size] = top
+            scores[start:start + chunk_size] = np.take_along_axis(chunk_scores, top, axis=1)
+        return item_indices, scores
+
+    def background_rows(self, X_scaled, df, exclude, max_points, seed=0):
+        # Stratified sample of at most max_points rows outside exclude, allocated to each class in
+        # proportion to its share of the population
+        candidates = np.setdiff1d(np.arange(len(X_scaled)), exclude)
+        if len(candidates) <= max_points:
+            return candidates
+        rng = np.random.default_rng(seed)
+        classes = df['class'].to_numpy()[candidates]
+        names, counts = np.unique(classes, return_counts=True)
+        quotas = np.floor(counts / len(candidates) * max_points).astype(int)
+        # Hand the rounding remainder to the classes with the largest fractional share
+        remainder = counts / len(candidates) * max_points - quotas
+        quotas[np.argsort(-remainder, kind='stable')[:max_points - quotas.sum()]] += 1
+        sampled = [
+            rng.choice(candidates[classes == name], size=quota, replace=False)
+            for name, quota in zip(names, quotas)
+        ]
+        return np.sort(np.concatenate(sampled))
+
+    def density_cells(self, X_scaled, exclude, max_points):
+        # Aggregates rows outside exclude into a grid over the first three scaled axes, at most
+        # max_points occupied cells; returns cell centroids and counts
+        keep = np.ones(len(X_scaled), dtype=bool)
+        keep[exclude] = False
+        points = X_scaled[keep, :3]
+        if len(points) == 0:
+            return points, np.zeros(0, dtype=np.int64)
+        bins = max(int(np.floor(max_points ** (1 / 3))), 1)
+        low, high = points.min(axis=0), points.max(axis=0)
+        cells = np.minimum(((points - low) / np.where(high > low, high - low, 1) * bins).astype(np.int64), bins - 1)
+        cell_ids = (cells[:, 0] * bins + cells[:, 1]) * bins + cells[:, 2]
+        unique_ids, inverse, counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+        centroids = np.empty((len(unique_ids), 3))
+        for axis in range(3):
+            centroids[:, axis] = np.bincount(inverse, weights=points[:, axis]) / counts
+        return centroids, counts
+
+    @instrumented('recommender.visualize_knn_with_labels')
+    def visualize_knn_with_labels(self, character, X_scaled, df, character_scaled, indices, max_points=5000,
+                                  background='sample'):
+        # background: 'sample' plots a stratified sample of at most max_points characters, 'density'
+        # at most max_points grid cells sized by how many characters they hold, 'all' every character.
+        # The input character and its neighbors are always plotted
+        import pandas as pd
+        import plotly.graph_objs as go
+
+        fig = go.Figure()
+
+        # Convert X_scaled to a numpy array if it's not already
+        if isinstance(X_scaled, pd.DataFrame):
+            X_scaled = X_scaled.to_numpy()
+
+        # Hover labels are filled in by plotly from customdata instead of one string per point
+        hovertemplate = 'Name: %{customdata[0]}<br>Class: %{customdata[1]}<br>Level: %{customdata[2]}<extra></extra>'
+        labels = df[['name', 'class', 'level']]
+        own_row = character._row if character._store is self.game.character_store else None
+        exclude = np.append(indices[0], [] if own_row is None else [own_row]).astype(np.intp)
+
+        if background == 'density':
+            centroids, counts = self.density_cells(X_scaled, exclude, max_points)
+            fig.add_trace(go.Scatter3d(
+                x=centroids[:, 0].astype(np.float32),
+                y=centroids[:, 1].astype(np.float32),
+                z=centroids[:, 2].astype(np.float32),
+                mode='markers',
+                marker=dict(size=(2 + 2 * np.log10(counts)).astype(np.float32), color='blue', opacity=0.3),
+                customdata=counts,
+                hovertemplate='%{customdata} characters<extra></extra>',
+                name=f'All Characters ({len(centroids)} cells)'
+            ))
+        else:
+            rows = np.arange(len(X_scaled)) if background == 'all' else self.background_rows(X_scaled, df, exclude, max_points)
+            sampled = len(rows) < len(X_scaled) - len(np.unique(exclude))
+            fig.add_trace(go.Scatter3d(
+                x=X_scaled[rows, 0].astype(np.float32),
+                y=X_scaled[rows, 1].astype(np.float32),
+                z=X_scaled[rows, 2].astype(np.float32),
+                mode='markers',
+                marker=dict(size=4, color='blue', opacity=0.5),
+                customdata=labels.iloc[rows].to_numpy(),
+                hovertemplate=hovertemplate,
+                name=f'All Characters ({len(rows)} of {len(X_scaled)})' if sampled else 'All Characters'
+            ))
+
+        # Plot the input character
+        fig.add_trace(go.Scatter3d(
+            x=[character_scaled[0][0]],
+            y=[character_scaled[0][1]],
+            z=[character_scaled[0][2]],
+            mode='markers',
+            marker=dict(size=8, color='red'),
+            customdata=[[character.name, character.char_class, character.level]],
+            hovertemplate=hovertemplate,
+            name='Input Character'
+        ))
+
+        # Plot the nearest neighbors
+        fig.add_trace(go.Scatter3d(
+            x=X_scaled[indices[0], 0],
+            y=X_scaled[indices[0], 1],
+            z=X_scaled[indices[0], 2],
+            mode='markers',
+            marker=dict(size=6, color='green'),
+            customdata=labels.iloc[indices[0]].to_numpy(),
+            hovertemplate=hovertemplate,
+            name='Nearest Neighbors'
+        ))
+
+        # Update layout with better labels and a title
+        fig.update_layout(
+            scene=dict(
+                xaxis_title='Strength (Scaled)',
+                yaxis_title='Intelligence (Scaled)',
+                zaxis_title='Dexterity (Scaled)'
+            ),
+            margin=dict(r=20, b=10, l=10, t=40),
+            title='Character Similarity Based on Attributes',
+            hovermode='closest'
+        )
+
+        fig.show()
+        return fig
+
+class ItemBrowser:
+    # Paginated item-card view over an ItemCatalog. Filters and sorting run on the catalog's
+    # compiled columns, and only the cards on the current page are rendered and sent to the page
+    def __init__(self, catalog, page_size=50):
+        import ipywidgets as widgets
+
+        self.catalog = catalog
+        self.page_size = page_size
+        self.page = 0
+        self.item_ids = np.zeros(0, dtype=np.intp)
+        compiled = catalog.compile()
+        max_power = int(compiled['power'].max()) if len(catalog) else 0
+        self.rarity = widgets.Dropdown(options=['All'] + compiled['rarity_names'], description='Rarity:')
+        self.item_type = widgets.Dropdown(options=['All'] + compiled['type_names'], description='Type:')
+        self.power = widgets.IntRangeSlider(value=[0, max_power], min=0, max=max_power, description='Power:')
+        self.sort_by = widgets.Dropdown(
+            options=[('Catalog order', 'id'), ('Power', 'power'), ('Rarity', 'rarity'), ('Type', 'item_type')],
+            description='Sort by:'
+        )
+        self.descending = widgets.Checkbox(value=False, description='Descending')
+        self.previous_button = widgets.Button(description='Previous')
+        self.next_button = widgets.Button(description='Next')
+        self.page_label = widgets.Label()
+        self.cards = widgets.HTML()
+
+        for control in [self.rarity, self.item_type, self.power, self.sort_by, self.descending]:
+            control.observe(self.apply_filters, names='value')
+        self.previous_button.on_click(lambda _: self.show_page(self.page - 1))
+        self.next_button.on_click(lambda _: self.show_page(self.page + 1))
+        self.apply_filters()
+
+    def apply_filters(self, _=None):
+        self.item_ids = self.catalog.query(
+            rarity=None if self.rarity.value == 'All' else self.rarity.value,
+            item_type=None if self.item_type.value == 'All' else self.item_type.value,
+            min_power=self.power.value[0],
+            max_power=self.power.value[1],
+            sort_by=self.sort_by.value,
+            descending=self.descending.value
+        )
+        self.show_page(0)
+
+    def page_count(self):
+        return max((len(self.item_ids) + self.page_size - 1) // self.page_size, 1)
+
+    def page_html(self, page):
+        start = page * self.page_size
+        cards = ''.join(self.catalog.card_html(item_id) for item_id in self.item_ids[start:start + self.page_size].tolist())
+        return f"{styles}<div style='display: flex; flex-wrap: wrap;'>{cards}</div>"
+
+    def show_page(self, page):
+        self.page = min(max(page, 0), self.page_count() - 1)
+        self.cards.value = self.page_html(self.page)
+        self.page_label.value = f"Page {self.page + 1} of {self.page_count()} ({len(self.item_ids)} items)"
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count() - 1
+
+    def display(self):
+        import ipywidgets as widgets
+        from IPython.display import display
+
+        display(widgets.VBox([
+            widgets.HBox([self.rarity, self.item_type, self.power]),
+            widgets.HBox([self.sort_by, self.descending]),
+            widgets.HBox([self.previous_button, self.page_label, self.next_button]),
+            self.cards,
+        ]))
+
+def inventory_widget():
+    # An anywidget renders the same way in the classic Notebook, JupyterLab, Notebook 7 and VS Code
+    import anywidget
+
+    class InventoryWidget(anywidget.AnyWidget):
+        _esm = inventory_js
+        _css = styles.replace('<style>', '').replace('</style>', '')
+
+    return InventoryWidget()
+
+class InventoryChannel:
+    # Kernel side of the inventory widget: each change goes out as one seq-numbered op, and the
+    # views send back sync and move requests
+    def __init__(self, game):
+        self.game = game
+        self.seq = 0
+        self.widget = inventory_widget()
+        self.widget.on_msg(self.on_message)
+
+    def on_message(self, _, data, buffers):
+        if data.get('op') == 'sync':
+            self.send_reset()
+        elif data.get('op') == 'move':
+            self.game.move_item(int(data['from']), int(data['to']))
+
+    def send(self, op, **fields):
+        self.seq += 1
+        self.widget.send({'seq': self.seq, 'op': op, **fields})
+
+    def send_reset(self):
+        self.widget.send({
+            'seq': self.seq,
+            'op': 'reset',
+            'items': [self.slot_data(item) for item in self.game.items],
+            'max_items': self.game.max_items,
+        })
+
+    @staticmethod
+    def slot_data(item):
+        return {'name': item.name, 'rarity': item.rarity, 'item_type': item.item_type}
+
+class RPGInventory:
+    def __init__(self, seed=None, instrumentation=None, compact=False):
+        # Shared with the recommender; enable it to collect per-stage timings
+        self.instrumentation = instrumentation or Instrumentation()
+        self.items = []
+        self.max_items = 10
+        # Created by display_inventory
+        self.inventory_channel = None
+        self.rng = np.random.default_rng(seed)
+        self.item_catalog = self.create_item_catalog()
+        # compact keeps uint8 stats and an int8 index, which is lossless for the default stat features
+        self.character_store = CharacterStore(item_catalog=self.item_catalog, compact=compact)
+        self.population_stats = PopulationStats(self.character_store)
+        self.recommender = KNNRecommender(self, backend='quantized' if compact else 'sklearn')
+
+    @property
+    def item_database(self):
+        # DataFrame view of the catalog, rebuilt only when the catalog changes
+        return self.item_catalog.to_frame()
+
+    @property
+    def item_database_version(self):
+        return self.item_catalog.version
+
+    def set_item_database(self, item_database):
+        # Accepts a DataFrame or a list of item dicts. Item ids are catalog positions, so
+        # replacing the catalog only makes sense together with the characters that refer to it
+        if hasattr(item_database, 'to_dict'):
+            item_database = item_database.to_dict(orient='records')
+        self.item_catalog.replace(Item(**item_data) for item_data in item_database)
+
+    def create_item_catalog(self):
+        items = [
+            Item("Steel Sword", "Weapon", "Common", 10, {"strength": 5}),
+            Item("Magic Staff", "Weapon", "Uncommon", 15, {"intelligence": 8}),
+            Item("Leather Armor", "Armor", "Common", 8, {"dexterity": 3}),
+            Item("Healing Potion", "Consumable", "Common", 5, {}),
+            Item("Dragon Scale", "Material", "Rare", 50, {}),
+            Item("Enchanted Bow", "Weapon", "Rare", 25, {"dexterity": 10}),
+            Item("Mithril Chainmail", "Armor", "Epic", 40, {"strength": 15, "dexterity": 10}),
+            Item("Philosopher's Stone", "Artifact", "Legendary", 100, {"intelligence": 20}),
+        ]
+        return ItemCatalog(items)
+
+    def generate_simulated_items(self, num_items=100, seed=None):
+        # Appends num_items random items to the catalog, each requiring up to two stats
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        rarities = rng.integers(0, len(RARITIES), num_items)
+        types = rng.integers(0, len(ITEM_TYPES), num_items)
+        powers = (rarities + 1) * rng.integers(5, 21, num_items)
+        requirements = rng.integers(1, 21, (num_items, len(ITEM_STATS)))
+        required_mask = rng.random((num_items, len(ITEM_STATS))) < 2 / len(ITEM_STATS)
+        offset = len(self.item_catalog)
+        self.item_catalog.add_many(
+            Item(
+                f"Item{offset + i + 1}", ITEM_TYPES[item_type], RARITIES[rarity], power,
+                {stat: value for stat, value, required in zip(ITEM_STATS, row, mask) if required}
+            )
+            for i, (item_type, rarity, power, row, mask) in enumerate(zip(
+                types.tolist(), rarities.tolist(), powers.tolist(), requirements.tolist(), required_mask.tolist()
+            ))
+        )
+        print(f"Generated {num_items} simulated items")
+
+    @property
+    def characters(self):
+        return CharacterSequence(self.character_store)
+
+    def add_character(self, character):
+        self.add_characters([character])
+
+    def add_characters(self, characters):
+        self.character_store.add_many(characters)
+
+    def remove_character(self, character):
+        return self.character_store.remove(character._row)
+
+    def add_item(self, item):
+        if len(self.items) < self.max_items:
+            self.items.append(item)
+            if self.inventory_channel is not None:
+                self.inventory_channel.send('add', slot=len(self.items) - 1, item=InventoryChannel.slot_data(item))
+            return True
+        return False
+
+    def remove_item(self, index):
+        if 0 <= index < len(self.items):
+            del self.items[index]
+            if self.inventory_channel is not None:
+                self.inventory_channel.send('remove', slot=index)
+            return True
+        return False
+
+    def move_item(self, from_index, to_index):
+        # Moves within the filled slots; a drop on an empty slot moves the item to the end
+        to_index = min(to_index, len(self.items) - 1)
+        if 0 <= from_index < len(self.items) and 0 <= to_index and from_index != to_index:
+            self.items.insert(to_index, self.items.pop(from_index))
+            if self.inventory_channel is not None:
+                self.inventory_channel.send('move', **{'from': from_index, 'to': to_index})
+            return True
+        return False
+
+    def create_item_html(self, item, index):
+        return f"""
+        <div class="item {item.rarity.lower()}" draggable="true" ondragstart="drag(event)"
+             ondrop="drop(event)" ondragover="allowDrop(event)" id="item-{index}">
+            {item.name}
+            <span class="tooltip">{item.item_type}</span>
+        </div>
+        """
+
+    def create_inventory_grid(self):
+        slots = [self.create_item_html(item, i) for i, item in enumerate(self.items)]
+        slots += ['<div class="item" ondrop="drop(event)" ondragover="allowDrop(event)"></div>'] * (self.max_items - len(self.items))
+        return f'<div class="inventory-grid">{"".join(slots)}</div>'
+
+    def inventory_html(self):
+        return f"""
+        {styles}
+        <div id="inventory-container">
+            {self.create_inventory_grid()}
+        </div>
+        """
+
+    @instrumented('game.display_inventory')
+    def display_inventory(self):
+        import ipywidgets as widgets
+        from IPython.display import display
+
+        # Later changes are sent to this widget as ops instead of displaying a new grid
+        self.inventory_channel = InventoryChannel(self)
+        display(self.inventory_channel.widget)
+        
+        add_button = widgets.Button(description="Add Random Item")
+        remove_button = widgets.Button(description="Remove Last Item")
+        
+        add_button.on_click(self.add_random_item)
+        remove_button.on_click(self.remove_last_item)
+        
+        display(widgets.HBox([add_button, remove_button]))
+
+    def add_random_item(self, _):
+        if len(self.items) < self.max_items:
+            self.add_item(self.item_catalog.items[self.rng.integers(len(self.item_catalog))])
+
+    def remove_last_item(self, _):
+        self.remove_item(len(self.items) - 1)
+
+    @instrumented('game.update_inventory')
+    def update_inventory(self):
+        # Item changes are sent as they happen; this resends the whole inventory, e.g. after
+        # self.items was modified directly
+        if self.inventory_channel is not None:
+            self.inventory_channel.send_reset()
+
+    @instrumented('game.display_item_database')
+    def display_item_database(self, page_size=50):
+        browser = ItemBrowser(self.item_catalog, page_size)
+        browser.display()
+        return browser
+
+    @instrumented('game.save_game_state')
+    def save_game_state(self, filename='game_state.json', file_format='json'):
+        # 'json' writes one interchange document; 'columnar' writes a directory of .npy arrays
+        # that load_game_state memory-maps
+        if file_format == 'columnar':
+            self.save_game_state_columnar(filename)
+            return
+        if file_format != 'json':
+            raise ValueError(f"Unknown game state format '{file_format}', expected 'json' or 'columnar'")
+
+        game_state = {
+            'characters': list(self.character_records()),
+            'item_database': self.item_catalog.records()
+        }
+
+        with open(filename, 'w') as f:
+            json.dump(game_state, f, default=int)
+        print(f"Game state saved to {filename}")
+
+    def save_game_state_columnar(self, directory):
+        self.character_store.save_columns(directory, {
+            'format_version': 1,
+            'item_database': self.item_catalog.records(),
+        })
+        print(f"Game state saved to {directory}")
+
+    def load_game_state_columnar(self, directory, mmap=True):
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.set_item_database(meta['item_database'])
+        self.character_store.load_columns(directory, meta, mmap=mmap)
+        print(f"Game state loaded from {directory}")
+
+    def character_records(self, start=0, stop=None):
+        # Character.to_dict() records built straight from the store columns, without
+        # materializing Character objects
+        store = self.character_store
+        stop = len(store) if stop is None else min(stop, len(store))
+        item_records = self.item_catalog.records()
+        columns = {column: store.columns[column][start:stop].tolist() for column in store.STAT_COLUMNS + ['class_code']}
+        for offset, row in enumerate(range(start, stop)):
+            yield {
+                'name': str(store.names[row]),
+                'class': store.class_names[columns['class_code'][offset]],
+                'level': columns['level'][offset],
+                'strength': columns['strength'][offset],
+                'intelligence': columns['intelligence'][offset],
+                'dexterity': columns['dexterity'][offset],
+                'inventory': [item_records[item_id] for item_id in store.inventory_ids(row).tolist()]
+            }
+
+    def add_character_records(self, records):
+        # Appends Character.to_dict() records to the store as columns, interning their items
+        store = self.character_store
+        inventories = [record['inventory'] for record in records]
+        inventory_items = self.item_catalog.register_items([item for inventory in inventories for item in inventory])
+        return store.add_columns(
+            [record['name'] for record in records],
+            np.array([store.class_code(record['class']) for record in records], dtype=np.int16),
+            *(np.array([record[column] for record in records], dtype=np.int32)
+              for column in ['strength', 'intelligence', 'dexterity', 'level']),
+            np.array([len(inventory) for inventory in inventories], dtype=np.int32),
+            np.array(inventory_items, dtype=np.int32)
+        )
+
+    @instrumented('game.export_characters_ndjson')
+    def export_characters_ndjson(self, filename, chunk_size=10000):
+        # One Character.to_dict() record per line, written a chunk at a time
+        store = self.character_store
+        with open(filename, 'w') as f:
+            for start in range(0, len(store), chunk_size):
+                lines = [json.dumps(record, default=int) for record in self.character_records(start, start + chunk_size)]
+                f.write('\n'.join(lines) + '\n')
+        print(f"Exported {len(store)} characters to {filename}")
+
+    @instrumented('game.import_characters_ndjson')
+    def import_characters_ndjson(self, filename, chunk_size=10000):
+        # Reads chunk_size lines at a time and appends each chunk to the character store as
+        # columns, so peak memory is bounded by the chunk rather than the file
+        imported = 0
+        with open(filename, 'r') as f:
+            while True:
+                records = [json.loads(line) for line in islice(f, chunk_size) if line.strip()]
+                if not records:
+                    break
+                self.add_character_records(records)
+                imported += len(records)
+        print(f"Imported {imported} characters from {filename}")
+
+    @instrumented('game.load_game_state')
+    def load_game_state(self, filename='game_state.json'):
+        if os.path.isdir(filename):
+            self.load_game_state_columnar(filename)
+        elif os.path.exists(filename):
+            with open(filename, 'r') as f:
+                game_state = json.load(f)
+            self.character_store.clear()
+            self.set_item_database(game_state['item_database'])
+            self.add_character_records(game_state['characters'])
+            print(f"Game state loaded from {filename}")
+        else:
+            print(f"No saved game state found at {filename}")
+
+    @instrumented('game.generate_simulated_players', rows=result_length)
+    def generate_simulated_players(self, num_players=100, seed=None):
+        # Every draw comes from one numpy Generator, so a given seed (or the seed passed to
+        # RPGInventory) reproduces the same population
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        store = self.character_store
+        class_codes = np.array([store.class_code(char_class) for char_class in CHARACTER_CLASSES], dtype=np.int16)
+        classes = class_codes[rng.integers(0, len(CHARACTER_CLASSES), num_players)]
+        levels = rng.integers(1, 51, num_players, dtype=np.int32)
+        stats = rng.integers(1, 21, (3, num_players), dtype=np.int32)
+        inventory_counts = rng.integers(0, self.max_items + 1, num_players, dtype=np.int32)
+        inventory_items = rng.integers(0, len(self.item_catalog), int(inventory_counts.sum()), dtype=np.int32)
+        rows = store.add_columns(
+            [f"Player{i+1}" for i in range(num_players)],
+            classes, stats[0], stats[1], stats[2], levels,
+            inventory_counts, inventory_items
+        )
+        print(f"Generated {num_players} simulated players")
+        return rows
+
+    @instrumented('game.visualize_player_data')
+    def visualize_player_data(self):
+        # Drawn from the running population aggregates, so the cost doesn't grow with the population
+        import pandas as pd
+        import seaborn as sns
+        import matplotlib.pyplot as plt
+
+        stats = self.population_stats
+        class_names = self.character_store.class_names
+
+        # Strength vs Intelligence by class, one marker per occupied cell sized by its player count
+        codes, strength, intelligence = np.nonzero(stats.joint_histogram)
+        joint = pd.DataFrame({
+            'strength': strength,
+            'intelligence': intelligence,
+            'class': [class_names[code] for code in codes],
+            'players': stats.joint_histogram[codes, strength, intelligence],
+        })
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+        sns.scatterplot(data=joint, x='strength', y='intelligence', hue='class', size='players', alpha=0.6, ax=ax1)
+        ax1.set_title('Strength vs Intelligence by Class')
+
+        # Heatmap of average stats by class
+        sns.heatmap(stats.class_means(), annot=True, cmap='YlGnBu', ax=ax2)
+        ax2.set_title('Average Stats by Class')
+
+        plt.tight_layout()
+        plt.show()
+
+        # Item distribution
+        item_counts = stats.inventory_size_histogram()
+        plt.figure(figsize=(10, 5))
+        plt.bar(np.arange(len(item_counts)), item_counts)
+        plt.title('Distribution of Items per Player')
+        plt.xlabel('Number of Items')
+        plt.ylabel('Count of Players')
+        plt.show()
+
+    @instrumented('game.get_recommendations_for_character')
+    def get_recommendations_for_character(self, character, max_points=5000, background='sample'):
+        recommendations, character_scaled, indices = self.recommender.get_recommendations(character)
+        print(f"Recommendations for {character.name}:")
+        for _, rec in recommendations.iterrows():
+            print(f"- {rec['name']} (Class: {rec['class']}, Level: {rec['level']})")
+        
+        # The plot needs every character, so the full frame and scaled matrix are only built here
+        _, df = self.recommender.prepare_data()
+        X_scaled = self.recommender.scaled_features()
+        self.recommender.visualize_knn_with_labels(
+            character, X_scaled, df, character_scaled, indices, max_points=max_points, background=background
+        )
@@ -0,0 +1,213 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from knn_rpg_core import RPGInventory
+
+# Offline job that precomputes neighbor lists and top item suggestions for every character into a
+# lookup table. The population is split into row chunks that a process pool answers with the
+# batched recommender paths; each worker writes its rows straight into the output columns, and a
+# chunk is recorded in the checkpoint once its rows are on disk. Running the same command again
+# resumes with the chunks that are missing.
+#
+#   python knn_rpg_precompute.py --output precomputed --players 1000000 --workers 4
+#   python knn_rpg_precompute.py --output precomputed --state game_state --k 10 --items 5
+#
+# Output directory:
+#   manifest.json             parameters of the run; written last, so its presence means setup finished
+#   state/, model/            snapshot of the game and the fitted recommender every worker loads
+#   neighbor_rows.npy         (n, k) int32 store rows, nearest first, -1 past the population
+#   neighbor_distances.npy    (n, k) float32 scaled distances, inf past the population
+#   item_ids.npy              (n, items) int32 catalog ids, best first
+#   item_scores.npy           (n, items) int32
+#   checkpoint.txt            indices of finished chunks, one per line
+
+OUTPUT_COLUMNS = {
+    'neighbor_rows': (np.int32, 'k', -1),
+    'neighbor_distances': (np.float32, 'k', np.inf),
+    'item_ids': (np.int32, 'n_items', -1),
+    'item_scores': (np.int32, 'n_items', 0),
+}
+
+# The game and the mapped output columns of a pool worker, loaded once by start_worker
+worker_state = {}
+
+def start_worker(directory):
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    # Library code reports progress with print(); one line per worker would only be noise
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = RPGInventory(compact=manifest['compact'])
+        game.load_game_state(os.path.join(directory, 'state'))
+        loaded = game.recommender.load_model(os.path.join(directory, 'model'))
+    if not loaded:
+        raise RuntimeError(f"The recommender model in {directory} doesn't match its game state snapshot")
+    worker_state['game'] = game
+    worker_state['outputs'] = {
+        column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r+') for column in OUTPUT_COLUMNS
+    }
+
+def compute_chunk(start, stop, k, n_items):
+    # Runs in a pool worker: fills rows [start, stop) of every output column and flushes them
+    recommender = worker_state['game'].recommender
+    outputs = worker_state['outputs']
+    rows = np.arange(start, stop)
+    matrix = recommender.feature_matrix(rows)
+    # Each character is left out of its own neighbor list
+    distances, indices = recommender.get_recommendations_batch(matrix, k, exclude_rows=rows)
+    outputs['neighbor_rows'][start:stop, :indices.shape[1]] = indices
+    outputs['neighbor_distances'][start:stop, :distances.shape[1]] = distances
+    item_ids, scores = recommender.recommend_items_batch(matrix, n_items)
+    outputs['item_ids'][start:stop, :item_ids.shape[1]] = item_ids
+    outputs['item_scores'][start:stop, :scores.shape[1]] = scores
+    for values in outputs.values():
+        values.flush()
+    return stop - start
+
+def chunk_bounds(n_characters, chunk_size):
+    return [(start, min(start + chunk_size, n_characters)) for start in range(0, n_characters, chunk_size)]
+
+def read_checkpoint(directory):
+    # A line cut short by a kill is ignored, so that chunk is simply computed again
+    path = os.path.join(directory, 'checkpoint.txt')
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return {int(line) for line in f.read().split('\n')[:-1] if line.strip().isdigit()}
+
+def trim_checkpoint(directory):
+    # Drops a line cut short by a kill, so the next chunk appended starts on a line of its own
+    path = os.path.join(directory, 'checkpoint.txt')
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        f.truncate(f.read().rfind(b'\n') + 1)
+
+def prepare_output(directory, game, k, n_items, chunk_size, compact):
+    # Snapshots the game and the model so every worker, and any later resume, answers from the
+    # same population, then allocates the output columns
+    os.makedirs(directory, exist_ok=True)
+    # Until the new manifest is written the directory must not look like a finished setup
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    n_characters = len(game.character_store)
+    manifest = {
+        'format_version': 1,
+        'n_characters': n_characters,
+        'k': min(k, max(n_characters - 1, 0)),
+        'n_items': min(n_items, len(game.item_catalog)),
+        'chunk_size': chunk_size,
+        'compact': compact,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    game.save_game_state(os.path.join(directory, 'state'), file_format='columnar')
+    game.recommender.save_model(os.path.join(directory, 'model'))
+    for column, (dtype, width, fill) in OUTPUT_COLUMNS.items():
+        values = np.lib.format.open_memmap(
+            os.path.join(directory, f'{column}.npy'), mode='w+', dtype=dtype, shape=(n_characters, manifest[width])
+        )
+        values[:] = fill
+        values.flush()
+        del values
+    checkpoint_path = os.path.join(directory, 'checkpoint.txt')
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    temporary_path = os.path.join(directory, 'manifest.json.tmp')
+    with open(temporary_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temporary_path, manifest_path)
+    return manifest
+
+def run_precompute(directory, workers=None):
+    # Computes every chunk missing from the checkpoint; returns the number of rows computed
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    bounds = chunk_bounds(manifest['n_characters'], manifest['chunk_size'])
+    done = read_checkpoint(directory)
+    pending = [chunk for chunk in range(len(bounds)) if chunk not in done]
+    n_characters = manifest['n_characters']
+    rows_done = sum(stop - start for chunk, (start, stop) in enumerate(bounds) if chunk in done)
+    if done:
+        print(f"Resuming: {len(done)} of {len(bounds)} chunks ({rows_done} rows) already computed")
+    if not pending:
+        print(f"All {n_characters} characters are already precomputed in {directory}")
+        return 0
+
+    trim_checkpoint(directory)
+    rows_computed = 0
+    start_time = time.perf_counter()
+    # spawn keeps workers independent of whatever threads the parent has running
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1, mp_context=context,
+                             initializer=start_worker, initargs=(directory,)) as pool, \
+            open(os.path.join(directory, 'checkpoint.txt'), 'a') as checkpoint:
+        futures = {
+            pool.submit(compute_chunk, *bounds[chunk], manifest['k'], manifest['n_items']): chunk
+            for chunk in pending
+        }
+        for future in as_completed(futures):
+            rows = future.result()
+            # The worker has flushed the rows, so the chunk can be recorded as done
+            checkpoint.write(f'{futures[future]}\n')
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            rows_computed += rows
+            rows_done += rows
+            elapsed = time.perf_counter() - start_time
+            rate = rows_computed / elapsed if elapsed > 0 else 0
+            remaining = (n_characters - rows_done) / rate if rate > 0 else 0
+            print(f"{rows_done:>10}/{n_characters} rows  {rate:>10.1f} rows/s  {remaining:>8.1f}s left", flush=True)
+    elapsed = time.perf_counter() - start_time
+    print(f"Precomputed {rows_computed} characters in {elapsed:.1f}s "
+          f"({rows_computed / elapsed if elapsed > 0 else 0:.1f} rows/s), results in {directory}")
+    return rows_computed
+
+def load_results(directory, allow_partial=False):
+    # The output columns as read-only memory maps, indexed by character store row
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    missing = len(chunk_bounds(manifest['n_characters'], manifest['chunk_size'])) - len(read_checkpoint(directory))
+    if missing and not allow_partial:
+        raise ValueError(f"{missing} chunks in {directory} have not been computed yet; rerun the job to resume")
+    return {column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r') for column in OUTPUT_COLUMNS}
+
+def build_game(args):
+    game = RPGInventory(seed=args.seed, compact=args.compact)
+    if args.state:
+        game.load_game_state(args.state)
+    else:
+        game.generate_simulated_players(args.players)
+    game.recommender.fit()
+    return game
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute neighbor lists and item suggestions for every character')
+    parser.add_argument('--output', required=True, help='output directory; an existing run there is resumed')
+    parser.add_argument('--state', help='saved game state (JSON file or columnar directory) to precompute')
+    parser.add_argument('--players', type=int, default=100000, help='simulated players when no --state is given')
+    parser.add_argument('--k', type=int, default=10, help='neighbors per character')
+    parser.add_argument('--items', type=int, default=5, help='item suggestions per character')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='rows per pool task and checkpoint step')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--compact', action='store_true', help='uint8 character stats and an int8 quantized index')
+    parser.add_argument('--restart', action='store_true', help='discard an existing run in --output and start over')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.restart or not os.path.exists(os.path.join(args.output, 'manifest.json')):
+        prepare_output(args.output, build_game(args), args.k, args.items, args.chunk_size, args.compact)
+    else:
+        # Parameters and population come from the manifest and snapshot of the run being resumed
+        print(f"Found a run in {args.output}; its population and parameters are used")
+    run_precompute(args.output, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from knn_rpg_core import ITEM_STATS, RPGInventory
+
+# Headless recommendation service. Requests that arrive within --max-wait-ms of each other (up to
+# --max-batch of them) are answered by one batched query against KNNRecommender, so the vectorized
+# batch paths do the work instead of one kneighbors call per request.
+#
+#   python knn_rpg_server.py serve --players 100000 --max-batch 256 --max-wait-ms 2
+#   python knn_rpg_server.py loadgen --concurrency 64 --requests 20000
+#
+# Endpoints (JSON in, JSON out):
+#   POST /neighbors  {"strength": 12, "intelligence": 7, "dexterity": 15, "level": 20, "k": 5}
+#                    or {"row": 42, "k": 5} to look up a stored character, which is left out of its own results
+#   POST /items      {"strength": 12, "intelligence": 7, "dexterity": 15, "k": 5}
+#   GET  /stats      batch sizes and per-request latency percentiles over the last STATS_WINDOW
+#                    batches and requests, plus running totals
+
+# Samples kept for /stats; older ones are dropped so a long-running server keeps a fixed footprint
+STATS_WINDOW = 10000
+
+class MicroBatcher:
+    # Collects requests of one kind until max_batch are waiting or max_wait has passed since the
+    # first one, then answers them all with a single call to run_batch(requests)
+    def __init__(self, run_batch, executor, max_batch=256, max_wait=0.002):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen=STATS_WINDOW)
+        self.n_batches = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.collect())
+
+    async def submit(self, request):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            self.n_batches += 1
+            requests = [request for request, _ in batch]
+            try:
+                # The recommender isn't thread-safe; the single-thread executor runs one batch at a
+                # time while the event loop keeps accepting requests for the next one
+                results = await loop.run_in_executor(self.executor, self.run_batch, requests)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class RecommendationServer:
+    def __init__(self, game, max_batch=256, max_wait=0.002):
+        self.game = game
+        self.recommender = game.recommender
+        self.executor = ThreadPoolExecutor(1)
+        self.batchers = {
+            '/neighbors': MicroBatcher(self.neighbor_batch, self.executor, max_batch, max_wait),
+            '/items': MicroBatcher(self.item_batch, self.executor, max_batch, max_wait),
+        }
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.n_requests = 0
+
+    def query_matrix(self, requests):
+        # Feature vectors for the batch, plus the store row to leave out for row lookups (-1 otherwise)
+        rows = np.array([request.get('row', -1) for request in requests], dtype=np.int64)
+        matrix = self.recommender.features.matrix_from_records(requests)
+        stored = rows >= 0
+        if stored.any():
+            matrix[stored] = self.recommender.feature_matrix(rows[stored])
+        return matrix, rows
+
+    def neighbor_batch(self, requests):
+        store = self.game.character_store
+        matrix, rows = self.query_matrix(requests)
+        # One query at the largest k in the batch; each request keeps its own first k
+        k = max(request.get('k', 5) for request in requests)
+        distances, indices = self.recommender.get_recommendations_batch(matrix, k, exclude_rows=rows)
+        results = []
+        for request, row_distances, row_indices in zip(requests, distances.tolist(), indices.tolist()):
+            n = request.get('k', 5)
+            results.append({'neighbors': [
+                {
+                    'row': row,
+                    'name': str(store.names[row]),
+                    'class': store.class_names[store.columns['class_code'][row]],
+                    **{stat: int(store.columns[stat][row]) for stat in store.STAT_COLUMNS},
+                    'distance': distance,
+                }
+                for row, distance in zip(row_indices[:n], row_distances[:n])
+            ]})
+        return results
+
+    def item_batch(self, requests):
+        item_records = self.game.item_catalog.records()
+        matrix, _ = self.query_matrix([{'level': 0, **request} for request in requests])
+        k = max(request.get('k', 5) for request in requests)
+        item_ids, scores = self.recommender.recommend_items_batch(matrix, k)
+        return [
+            {'items': [
+                {**item_records[item_id], 'score': score}
+                for item_id, score in zip(row_ids[:request.get('k', 5)], row_scores[:request.get('k', 5)])
+            ]}
+            for request, row_ids, row_scores in zip(requests, item_ids.tolist(), scores.tolist())
+        ]
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': self.n_requests,
+            'p50_latency_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_latency_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batches': {
+                path: {
+                    'count': batcher.n_batches,
+                    'mean_size': float(np.mean(batcher.batch_sizes)) if batcher.batch_sizes else None,
+                    'max_size': max(batcher.batch_sizes, default=None),
+                }
+                for path, batcher in self.batchers.items()
+            },
+            'cache': self.recommender.cache_stats(),
+        }
+
+    def validate(self, path, request):
+        # Rejects bad requests before they reach a batch, where one error would fail every request in it
+        if not isinstance(request, dict):
+            raise ValueError("Expected a JSON object")
+        if not isinstance(request.get('k', 5), int) or request.get('k', 5) < 1:
+            raise ValueError("'k' must be a positive integer")
+        if 'row' in request:
+            if not isinstance(request['row'], int) or not 0 <= request['row'] < len(self.game.character_store):
+                raise ValueError(f"Row {request['row']} is out of range")
+            return request
+        # Items only depend on the ITEM_STATS, neighbors on every feature; one-hot class columns
+        # come from an optional 'class' key instead
+        columns = [column for column in self.recommender.features.columns if not column.startswith('class:')]
+        required = columns if path == '/neighbors' else ITEM_STATS
+        missing = [feature for feature in required if not isinstance(request.get(feature), (int, float))]
+        if missing:
+            raise ValueError(f"Expected 'row' or numeric {required}, missing {missing}")
+        return request
+
+    async def handle_request(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        if method != 'POST' or path not in self.batchers:
+            return 404, {'error': f"No endpoint {method} {path}"}
+        try:
+            request = self.validate(path, json.loads(body or b'{}'))
+        except (ValueError, TypeError) as error:
+            return 400, {'error': str(error)}
+        start = time.perf_counter()
+        result = await self.batchers[path].submit(request)
+        self.latencies.append(time.perf_counter() - start)
+        self.n_requests += 1
+        return 200, result
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive, enough for JSON clients and the load generator
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, payload = await self.handle_request(method, path, body)
+                except Exception as error:
+                    status, payload = 500, {'error': repr(error)}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        for batcher in self.batchers.values():
+            batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving recommendations for {len(self.game.character_store)} characters on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+async def post_json(reader, writer, path, payload):
+    data = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def run_load(host, port, n_requests, concurrency, item_share, k, seed):
+    # Each client holds one keep-alive connection and sends its next request as soon as the
+    # previous one is answered, with random stat vectors in the simulated players' ranges
+    rng = np.random.default_rng(seed)
+    stats = rng.integers(1, 21, (n_requests, 3)).tolist()
+    levels = rng.integers(1, 51, n_requests).tolist()
+    paths = np.where(rng.random(n_requests) < item_share, '/items', '/neighbors').tolist()
+    latencies = []
+    errors = 0
+    next_request = iter(range(n_requests))
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        for i in next_request:
+            payload = {'strength': stats[i][0], 'intelligence': stats[i][1], 'dexterity': stats[i][2],
+                       'level': levels[i], 'k': k}
+            start = time.perf_counter()
+            status, _ = await post_json(reader, writer, paths[i], payload)
+            latencies.append(time.perf_counter() - start)
+            errors += status != 200
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall_seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'wall_seconds': wall_seconds,
+        'requests_per_second': n_requests / wall_seconds,
+        'p50_latency_ms': float(np.percentile(latencies, 50)),
+        'p99_latency_ms': float(np.percentile(latencies, 99)),
+    }
+
+def build_game(args):
+    game = RPGInventory(seed=args.seed, compact=args.compact)
+    if args.state:
+        game.load_game_state(args.state)
+    else:
+        game.generate_simulated_players(args.players)
+    if args.model:
+        game.recommender.warm_start(args.model)
+    else:
+        game.recommender.fit()
+    return game
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-batching recommendation server for the KNN RPG recommender')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--state', help='saved game state (JSON file or columnar directory) to serve')
+    serve.add_argument('--players', type=int, default=100000, help='simulated players when no --state is given')
+    serve.add_argument('--model', help='directory to warm-start the recommender model from')
+    serve.add_argument('--max-batch', type=int, default=256, help='most requests answered by one batched query')
+    serve.add_argument('--max-wait-ms', type=float, default=2.0,
+                       help='longest a request waits for others to join its batch')
+    serve.add_argument('--compact', action='store_true', help='uint8 character stats and an int8 quantized index')
+    serve.add_argument('--seed', type=int, default=0)
+
+    loadgen = subparsers.add_parser('loadgen')
+    loadgen.add_argument('--host', default='127.0.0.1')
+    loadgen.add_argument('--port', type=int, default=8765)
+    loadgen.add_argument('--requests', type=int, default=10000)
+    loadgen.add_argument('--concurrency', type=int, default=64)
+    loadgen.add_argument('--item-share', type=float, default=0.5, help='share of requests sent to /items')
+    loadgen.add_argument('--k', type=int, default=5)
+    loadgen.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        server = RecommendationServer(build_game(args), args.max_batch, args.max_wait_ms / 1000)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = asyncio.run(run_load(
+            args.host, args.port, args.requests, args.concurrency, args.item_share, args.k, args.seed
+        ))
+        print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from knn_rpg_core import BruteForceBackend, ShardedBruteForceBackend, RPGInventory
+
+
+@pytest.fixture(scope='module')
+def scaled_stats():
+    # Integer stats, so many rows tie at the same distance
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(3000)
+    game.recommender.fit()
+    return game.recommender.scaled_features()
+
+
+@pytest.mark.parametrize('n_shards, n_workers', [(1, 1), (3, 2), (7, 2)])
+def test_sharded_matches_brute_force(scaled_stats, n_shards, n_workers):
+    queries = scaled_stats[::25]
+    expected_distances, expected_indices = BruteForceBackend().fit(scaled_stats).kneighbors(queries, 15)
+    backend = ShardedBruteForceBackend(n_workers=n_workers, n_shards=n_shards).fit(scaled_stats)
+    try:
+        distances, indices = backend.kneighbors(queries, 15)
+    finally:
+        backend.close()
+    assert np.array_equal(indices, expected_indices)
+    assert np.array_equal(distances, expected_distances)
+
+
+def test_brute_force_chunking_does_not_change_results(scaled_stats):
+    queries = scaled_stats[:200]
+    expected = BruteForceBackend().fit(scaled_stats).kneighbors(queries, 10)
+    small_blocks = BruteForceBackend(chunk_size=7, max_block_values=5000).fit(scaled_stats).kneighbors(queries, 10)
+    assert np.array_equal(expected[1], small_blocks[1])
+    assert np.array_equal(expected[0], small_blocks[0])
+
+
+def test_rp_forest_pads_when_leaves_run_out(scaled_stats):
+    from knn_rpg_core import RandomProjectionForestBackend, evaluate_neighbor_backend
+
+    backend = RandomProjectionForestBackend(n_trees=2, leaf_size=64).fit(scaled_stats)
+    distances, indices = backend.kneighbors(scaled_stats[:5], 200)
+    assert distances.shape == indices.shape == (5, 200)
+    assert (indices[:, 128:] == -1).all() and np.isinf(distances[:, 128:]).all()
+    found = indices >= 0
+    assert np.isfinite(distances[found]).all()
+    assert evaluate_neighbor_backend(backend, scaled_stats, k=200, n_queries=20)['recall_at_k'] <= 128 / 200
+
+
+def test_recommender_with_rp_forest_survives_many_stale_rows():
+    game = RPGInventory(seed=1)
+    game.generate_simulated_players(10000)
+    recommender = game.recommender
+    recommender.backend = 'rp_forest'
+    recommender.fit()
+    # 600 edits stay under the 10% rebuild threshold but exceed the 512 candidates of the forest
+    for row in range(600):
+        game.characters[row].strength = 1 + row % 20
+    assert recommender.n_indexed == 10000 and len(recommender.stale_rows) == 600
+    distances, indices = recommender.get_recommendations_batch(game.characters[1000:1010], 5)
+    assert indices.shape == (10, 5)
+    assert (indices >= 0).all() and np.isfinite(distances).all()
+
+
+@pytest.mark.parametrize('k', [1, 5, 40, 300])
+def test_select_k_smallest_matches_stable_sort(k):
+    from knn_rpg_core import select_k_smallest
+
+    rng = np.random.default_rng(k)
+    # Few distinct values, so most selections cut through a run of ties
+    distances = rng.integers(0, 6, (50, 300)).astype(np.float64)
+    distances[:, ::7] = np.inf
+    values, columns = select_k_smallest(distances, k)
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    assert np.array_equal(columns, order)
+    assert np.array_equal(values, np.take_along_axis(distances, order, axis=1))
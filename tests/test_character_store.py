@@ -0,0 +1,121 @@
+import numpy as np
+
+from knn_rpg_core import Character, RPGInventory
+
+
+def population_totals(game):
+    stats = game.population_stats
+    return stats.counts.copy(), stats.sums.copy()
+
+
+def recomputed_totals(game):
+    store = game.character_store
+    codes = store.column('class_code').astype(np.intp)
+    n_classes = len(game.population_stats.counts)
+    sums = np.stack([
+        np.bincount(codes, weights=store.column(column), minlength=n_classes)
+        for column in store.STAT_COLUMNS
+    ], axis=1).astype(np.int64)
+    return np.bincount(codes, minlength=n_classes), sums
+
+
+def test_columnar_save_over_mapped_directory(tmp_path):
+    directory = str(tmp_path / 'state')
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(20000)
+    game.save_game_state(directory, file_format='columnar')
+
+    loaded = RPGInventory()
+    loaded.load_game_state(directory)
+    loaded.characters[3].strength = 19
+    loaded.characters[5].inventory = []
+    loaded.character_store.remove(7)
+    expected = [record for record in loaded.character_records()]
+    # Saving back to the directory the columns are mapped from must not truncate them
+    loaded.save_game_state(directory, file_format='columnar')
+    assert [record for record in loaded.character_records()] == expected
+
+    reloaded = RPGInventory()
+    reloaded.load_game_state(directory)
+    assert [record for record in reloaded.character_records()] == expected
+    assert not [name for name in (tmp_path / 'state').iterdir() if name.suffix == '.tmp']
+
+
+def test_remove_last_row_after_columnar_load(tmp_path):
+    directory = str(tmp_path / 'state')
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(100)
+    game.save_game_state(directory, file_format='columnar')
+
+    loaded = RPGInventory()
+    loaded.load_game_state(directory)
+    last_name = loaded.character_store.names[-1]
+    removed = loaded.character_store.remove(len(loaded.character_store) - 1)
+    assert removed is None
+    assert len(loaded.character_store) == 99
+    assert last_name not in loaded.character_store.names
+    counts, sums = population_totals(loaded)
+    expected_counts, expected_sums = recomputed_totals(loaded)
+    assert np.array_equal(counts, expected_counts)
+    assert np.array_equal(sums, expected_sums)
+
+
+def test_inventory_edits_write_through_to_the_store():
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(20)
+    catalog = game.item_catalog
+    character = game.characters[2]
+    character.inventory = catalog.items[:3]
+    character.inventory.append(catalog.items[5])
+    assert [item.name for item in character.inventory] == [item.name for item in catalog.items[:3]] + [catalog.items[5].name]
+    character.inventory.remove(catalog.items[0])
+    del character.inventory[0]
+    inventory = character.inventory
+    inventory += [catalog.items[7]]
+    assert character.inventory == [catalog.items[2], catalog.items[5], catalog.items[7]]
+    assert game.character_store.column('inventory_count')[2] == 3
+    assert game.population_stats.inventory_size_histogram().sum() == 20
+
+
+def test_from_dict_shares_catalog_items():
+    game = RPGInventory(seed=0)
+    catalog = game.item_catalog
+    data = {
+        'name': 'Ayla', 'class': 'Rogue', 'level': 7, 'strength': 4, 'intelligence': 9, 'dexterity': 15,
+        'inventory': [catalog.items[1].to_dict(), catalog.items[1].to_dict(),
+                      {'name': 'Lost Relic', 'item_type': 'Artifact', 'rarity': 'Epic', 'power': 40,
+                       'required_stats': {'intelligence': 8}}],
+    }
+    n_items = len(catalog)
+    first = Character.from_dict(data, item_catalog=catalog)
+    second = Character.from_dict(data, item_catalog=catalog)
+    assert first.inventory[0] is first.inventory[1] is catalog.items[1]
+    assert all(a is b for a, b in zip(first.inventory, second.inventory))
+    # Unknown items are registered once
+    assert len(catalog) == n_items + 1 and first.inventory[2] is catalog.items[n_items]
+    game.add_character(first)
+    assert game.characters[0].inventory == first.inventory
+    # Without a catalog every slot is still its own Item
+    detached = Character.from_dict(data)
+    assert detached.inventory[0] is not detached.inventory[1]
+
+
+def test_inventory_pool_reclaims_replaced_segments():
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(1000)
+    store = game.character_store
+    items = game.item_catalog.items
+    expected = {row: [item.name for item in store.inventory_items(row)] for row in range(0, 1000, 97)}
+    character = game.characters[5]
+    for step in range(20000):
+        character.inventory = items[:1 + step % 8]
+    expected[5] = [item.name for item in items[:1 + 19999 % 8]]
+    for row in range(100, 400):
+        store.remove(100)
+    live = int(store.column('inventory_count').sum())
+    assert store.inventory_pool_size - store.dead_inventory_items == live
+    assert store.inventory_pool_size <= 2 * live + 1024
+    assert [item.name for item in store.inventory_items(5)] == expected[5]
+    # Swap-removing row 100 only ever moves the last rows, so these keep their place
+    for row in (0, 97, 485, 873):
+        assert [item.name for item in store.inventory_items(row)] == expected[row]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from knn_rpg_core import FEATURES, BruteForceBackend, FeaturePipeline, RPGInventory
+
+
+def make_game(n_players=2000):
+    game = RPGInventory(seed=3)
+    game.generate_simulated_items(40)
+    game.generate_simulated_players(n_players)
+    return game
+
+
+def test_derived_columns_follow_inventory_changes():
+    game = make_game()
+    recommender = game.recommender
+    recommender.set_features(FEATURES + ['item_power', 'rarity_counts', 'type_counts', 'class_onehot'])
+    recommender.fit()
+    catalog = game.item_catalog
+    game.characters[4].inventory = game.characters[4].inventory + [catalog.items[2], catalog.items[30]]
+    game.characters[9].inventory = []
+    game.character_store.remove(11)
+    game.generate_simulated_players(10)
+    fresh = FeaturePipeline(game, recommender.features.columns)
+    assert np.array_equal(recommender.feature_matrix(), fresh.matrix())
+
+
+def test_inventory_change_moves_the_character_in_the_index():
+    game = make_game()
+    recommender = game.recommender
+    recommender.set_features(FEATURES + ['item_power'])
+    recommender.fit()
+    row = 17
+    stone = next(item for item in game.item_catalog.items if item.name == "Philosopher's Stone")
+    vector = recommender.feature_matrix(np.array([row]))
+    recommender.get_recommendations_batch(vector, 3)
+    game.characters[row].inventory = [stone] * 10
+
+    vector = recommender.feature_matrix(np.array([row]))
+    distances, indices = recommender.get_recommendations_batch(vector, 3)
+    exact = BruteForceBackend().fit(recommender.transform(recommender.feature_matrix()))
+    expected_distances, _ = exact.kneighbors(recommender.transform(vector), 3)
+    assert indices[0, 0] == row and distances[0, 0] == 0
+    assert np.allclose(distances, expected_distances)
+
+
+def test_default_pipeline_is_the_stat_columns():
+    game = make_game(500)
+    store = game.character_store
+    expected = np.column_stack([store.column(column) for column in FEATURES]).astype(np.float64)
+    assert np.array_equal(game.recommender.feature_matrix(), expected)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from knn_rpg_core import Character, RPGInventory
+
+
+def reference_filtered(recommender, characters, k, level_band, owned_item=None):
+    # Per-query brute force over the rows passing the filters, like a pandas groupby-and-filter
+    store = recommender.game.character_store
+    X_scaled = recommender.transform(recommender.feature_matrix())
+    codes = store.column('class_code')
+    levels = store.column('level').astype(np.int64)
+    owners = None
+    if owned_item is not None:
+        owners = np.array([owned_item in store.inventory_ids(row) for row in range(len(store))])
+    results = []
+    for character in characters:
+        query = recommender.transform(recommender.features.for_characters([character]))[0]
+        mask = (codes == store.class_codes[character.char_class]) & (np.abs(levels - character.level) <= level_band)
+        if owners is not None:
+            mask &= owners
+        mask[character._row] = False
+        rows = np.flatnonzero(mask)
+        distances = np.sqrt(((X_scaled[rows] - query) ** 2).sum(axis=1))
+        order = np.argsort(distances, kind='stable')[:k]
+        results.append((distances[order], rows[order]))
+    return results
+
+
+def check_against_reference(recommender, characters, k=6, level_band=3, owned_item=None):
+    owned_items = [owned_item] if owned_item is not None else None
+    distances, indices = recommender.filtered_neighbors_batch(characters, k, level_band=level_band, owned_items=owned_items)
+    store = recommender.game.character_store
+    for character, row_distances, row_indices, (expected_distances, expected_rows) in zip(
+        characters, distances, indices, reference_filtered(recommender, characters, k, level_band, owned_item)
+    ):
+        found = row_indices >= 0
+        assert found.sum() == len(expected_rows)
+        assert np.allclose(row_distances[found], expected_distances)
+        for row in row_indices[found]:
+            assert store.class_names[store.columns['class_code'][row]] == character.char_class
+            assert abs(int(store.columns['level'][row]) - character.level) <= level_band
+            assert row != character._row
+
+
+@pytest.mark.parametrize('owned_item', [None, 3])
+def test_filtered_neighbors_follow_edits(owned_item):
+    rng = np.random.default_rng(5)
+    game = RPGInventory(seed=5)
+    game.generate_simulated_players(4000)
+    recommender = game.recommender
+    recommender.staleness_threshold = 1.0
+    recommender.min_rebuild_rows = 10 ** 6
+    recommender.fit()
+    check_against_reference(recommender, game.characters[:50], owned_item=owned_item)
+    partitions = recommender.partition_index()
+
+    for step in range(200):
+        store = game.character_store
+        action = step % 4
+        if action == 0:
+            game.add_character(Character(f'New{step}', ['Warrior', 'Mage', 'Rogue'][step % 3], int(rng.integers(1, 51))))
+        elif action == 1:
+            game.characters[int(rng.integers(0, len(store)))].level = int(rng.integers(1, 51))
+        elif action == 2:
+            game.characters[int(rng.integers(0, len(store)))].char_class = 'Rogue'
+        else:
+            store.remove(int(rng.integers(0, len(store))))
+    queries = [game.characters[row] for row in rng.choice(len(game.character_store), 60, replace=False)]
+    check_against_reference(recommender, queries, owned_item=owned_item)
+    # Edits below the rebuild threshold leave the partitions in place
+    assert recommender.partition_index() is partitions
+
+    recommender.fit()
+    assert recommender.partition_index() is not partitions
+    check_against_reference(recommender, queries, owned_item=owned_item)
@@ -0,0 +1,171 @@
+import time
+
+import numpy as np
+import pytest
+
+from knn_rpg_core import BruteForceBackend, Character, RPGInventory
+
+
+def exact_neighbors(recommender, queries_scaled, k):
+    # Brute force over the current store, scaled with the scaler of the last rebuild
+    X_scaled = recommender.transform(recommender.feature_matrix())
+    return BruteForceBackend().fit(X_scaled).kneighbors(queries_scaled, k), X_scaled
+
+
+@pytest.mark.parametrize('backend', ['brute', 'sklearn', 'rp_forest'])
+def test_incremental_index_matches_brute_force(backend):
+    rng = np.random.default_rng(7)
+    game = RPGInventory(seed=7)
+    game.generate_simulated_players(3000)
+    recommender = game.recommender
+    recommender.backend = backend
+    # Keep every change below the rebuild threshold so the stale/pending path answers
+    recommender.staleness_threshold = 1.0
+    recommender.min_rebuild_rows = 10 ** 6
+    recommender.fit()
+
+    for step in range(300):
+        action = rng.integers(0, 3)
+        store = game.character_store
+        if action == 0:
+            character = Character(f'New{step}', 'Mage', int(rng.integers(1, 51)))
+            game.add_character(character)
+        elif action == 1:
+            character = game.characters[int(rng.integers(0, len(store)))]
+            setattr(character, ['strength', 'intelligence', 'dexterity', 'level'][step % 4], int(rng.integers(1, 21)))
+        else:
+            store.remove(int(rng.integers(0, len(store))))
+    assert recommender.n_indexed == 3000 and recommender.stale_rows
+
+    queries = recommender.transform(recommender.feature_matrix(rng.choice(len(game.character_store), 200)))
+    k = 10
+    distances, indices = recommender.kneighbors(queries, k)
+    (expected_distances, _), X_scaled = exact_neighbors(recommender, queries, k)
+    if backend == 'rp_forest':
+        # Approximate index: every returned neighbor must still be a current row at its true distance
+        found = indices >= 0
+        true = np.sqrt(((X_scaled[indices[found]] - np.repeat(queries, found.sum(axis=1), axis=0)) ** 2).sum(axis=1))
+        assert np.allclose(distances[found], true)
+        return
+    assert np.allclose(distances, expected_distances)
+    true = np.sqrt(((X_scaled[indices] - queries[:, None, :]) ** 2).sum(axis=2))
+    assert np.allclose(distances, true)
+    assert all(len(set(row)) == k for row in indices.tolist())
+
+
+def test_large_pending_merge_is_chunked():
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(20000)
+    recommender = game.recommender
+    recommender.backend = 'brute'
+    recommender.fit()
+    game.generate_simulated_players(1500)
+    assert len(game.character_store) - recommender.n_indexed == 1500
+    queries = recommender.feature_matrix(np.arange(2000))
+    distances, indices = recommender.get_recommendations_batch(queries, 5, exclude_rows=np.arange(2000))
+    (expected_distances, _), _ = exact_neighbors(recommender, recommender.transform(queries), 6)
+    # Each query is a stored row, which is left out of its own results
+    assert np.allclose(distances, expected_distances[:, 1:])
+    assert not (indices == np.arange(2000)[:, None]).any()
+
+
+def test_stale_rows_do_not_widen_index_queries():
+    rng = np.random.default_rng(1)
+    game = RPGInventory(seed=1)
+    game.generate_simulated_players(50000)
+    recommender = game.recommender
+    recommender.fit()
+    store = game.character_store
+    queries = recommender.feature_matrix(np.arange(2000))
+    start = time.perf_counter()
+    recommender.get_recommendations_batch(queries, 5)
+    fresh_seconds = time.perf_counter() - start
+
+    for row in rng.choice(50000, 4000, replace=False).tolist():
+        store.set_value(row, 'strength', int(rng.integers(1, 21)))
+    assert len(recommender.stale_rows) == 4000 and recommender.n_indexed == 50000
+    fetched = []
+    index_kneighbors = recommender.knn_model.kneighbors
+
+    def counting_kneighbors(X, n_neighbors):
+        fetched.append(len(X) * n_neighbors)
+        return index_kneighbors(X, n_neighbors)
+
+    recommender.knn_model.kneighbors = counting_kneighbors
+    start = time.perf_counter()
+    distances, indices = recommender.get_recommendations_batch(queries, 5)
+    stale_seconds = time.perf_counter() - start
+
+    (expected_distances, _), _ = exact_neighbors(recommender, recommender.transform(queries), 5)
+    assert np.allclose(distances, expected_distances)
+    # A margin past k is fetched, not k + len(stale_rows) per query; the exact pass over the
+    # 4000 pending rows is what remains of the extra time
+    assert sum(fetched) <= 4 * 2000 * (5 + 8)
+    assert stale_seconds < 50 * fresh_seconds + 1.0
+
+
+def test_stale_rows_are_capped():
+    game = RPGInventory(seed=1)
+    game.generate_simulated_players(5000)
+    recommender = game.recommender
+    recommender.max_stale_rows = 100
+    recommender.fit()
+    for row in range(101):
+        game.characters[row].strength = 1 + row % 20
+    # 101 stale rows is below 10% of the index but past the cap, so the index was rebuilt
+    assert len(recommender.stale_rows) < 101
+
+
+def test_get_recommendations_reads_only_neighbor_rows():
+    game = RPGInventory(seed=3)
+    game.generate_simulated_players(2000)
+    recommender = game.recommender
+    recommender.fit()
+    game.characters[5].strength = 1
+    character = game.characters[10]
+    recommendations, character_scaled, indices = recommender.get_recommendations(character)
+    # Neither the whole-population frame nor the scaled matrix is built for a single query
+    assert recommender.prepared_data is None and recommender.scaled_data is None
+    assert 10 not in indices[0]
+    expected = game.character_store.to_frame().iloc[indices[0]]
+    assert list(recommendations.index) == list(indices[0])
+    assert (recommendations.to_numpy() == expected.to_numpy()).all()
+
+
+def test_index_api_takes_characters():
+    game = RPGInventory(seed=2)
+    game.generate_simulated_players(1000)
+    recommender = game.recommender
+    recommender.fit()
+    newcomer = Character.from_stats('Newcomer', 'Mage', 60, 20, 20, 20)
+    recommender.add_characters([newcomer])
+    query = np.array([[20, 20, 20, 60]], dtype=np.float64)
+    _, indices = recommender.get_recommendations_batch(query, 1)
+    assert indices[0, 0] == newcomer._row
+
+    recommender.update_character(newcomer, strength=1, intelligence=1, dexterity=1, level=1)
+    _, indices = recommender.get_recommendations_batch(query, 3)
+    assert newcomer._row not in indices[0]
+    assert recommender.n_indexed == 1000
+
+    recommender.remove_character(newcomer)
+    assert len(game.character_store) == 1000
+    _, indices = recommender.get_recommendations_batch(recommender.feature_matrix(np.arange(1000)), 3)
+    assert (indices < 1000).all()
+    with pytest.raises(ValueError):
+        recommender.update_character(Character('Stranger', 'Rogue'), level=2)
+
+
+def test_one_player_population_returns_empty_neighbor_lists():
+    game = RPGInventory(seed=0)
+    game.generate_simulated_players(1)
+    recommender = game.recommender
+    recommendations, _, indices = recommender.get_recommendations(game.characters[0])
+    assert len(recommendations) == 0 and indices.shape == (1, 0)
+    distances, indices = recommender.get_recommendations_batch(game.characters[:1], 5)
+    assert distances.shape == indices.shape == (1, 0)
+    # k=0, as the precompute job asks for when there is a single character
+    distances, indices = recommender.get_recommendations_batch(recommender.feature_matrix([0]), 0, exclude_rows=[0])
+    assert indices.shape == (1, 0)
+    item_ids, _ = recommender.collaborative_items_batch(None, 3)
+    assert (item_ids == -1).all()
@@ -0,0 +1,54 @@
+import pytest
+
+from knn_rpg_core import Instrumentation, RPGInventory
+
+
+def test_instrumented_records_rows():
+    game = RPGInventory(seed=0, instrumentation=Instrumentation(enabled=True))
+    game.generate_simulated_players(50)
+    game.recommender.get_recommendations_batch(game.characters[:7], 3)
+    stats = game.instrumentation.snapshot()
+    assert stats['recommender.get_recommendations_batch']['calls'] == 1
+    assert stats['recommender.get_recommendations_batch']['rows'] == 7
+
+
+def test_instrumented_records_failed_calls():
+    game = RPGInventory(seed=0, instrumentation=Instrumentation(enabled=True))
+    game.generate_simulated_players(50)
+    game.recommender.fit()
+    with pytest.raises(Exception):
+        game.recommender.get_recommendations_batch(object(), 3)
+    stats = game.instrumentation.snapshot()['recommender.get_recommendations_batch']
+    assert stats['calls'] == 1
+    assert stats['rows'] == 0
+
+
+def test_single_character_request_records_each_stage():
+    calls = []
+    game = RPGInventory(seed=0, instrumentation=Instrumentation())
+    game.generate_simulated_players(50)
+    game.recommender.fit()
+    game.instrumentation.enable(hook=lambda stage, seconds, rows: calls.append((stage, rows)))
+    game.recommender.get_recommendations(game.characters[3])
+    stages = [stage for stage, _ in calls]
+    # Inner stages finish, and reach the hook, before the call that contains them
+    assert stages == ['recommender.scale_queries', 'recommender.kneighbors', 'recommender.get_recommendations']
+    assert calls[0][1] == 1 and calls[1][1] == 1
+    assert set(game.instrumentation.snapshot()) == set(stages)
+
+
+def test_disabled_instrumentation_records_nothing():
+    calls = []
+    game = RPGInventory(seed=0, instrumentation=Instrumentation(hook=lambda *args: calls.append(args)))
+    game.generate_simulated_players(50)
+    game.recommender.get_recommendations(game.characters[3])
+    game.recommender.get_recommendations_batch(game.characters[:5], 3)
+    assert game.instrumentation.snapshot() == {} and calls == []
+
+    game.instrumentation.enable()
+    game.recommender.get_recommendations_batch(game.characters[:5], 3)
+    game.instrumentation.disable()
+    game.recommender.get_recommendations_batch(game.characters[:5], 3)
+    assert game.instrumentation.snapshot()['recommender.get_recommendations_batch']['calls'] == 1
+    # The hook saw exactly the calls made while enabled
+    assert len(calls) == sum(stats['calls'] for stats in game.instrumentation.stats.values())
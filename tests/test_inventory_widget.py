@@ -0,0 +1,26 @@
+import pytest
+
+from knn_rpg_core import InventoryChannel, RPGInventory
+
+pytest.importorskip('anywidget')
+
+
+def test_changes_go_out_as_seq_numbered_ops():
+    game = RPGInventory(seed=0)
+    game.inventory_channel = channel = InventoryChannel(game)
+    sent = []
+    channel.widget.send = sent.append
+    items = game.item_catalog.items
+    game.add_item(items[0])
+    game.add_item(items[1])
+    game.remove_item(0)
+    assert [(message['seq'], message['op']) for message in sent] == [(1, 'add'), (2, 'add'), (3, 'remove')]
+    assert sent[1]['slot'] == 1 and sent[1]['item']['name'] == items[1].name
+
+    # A view's sync request is answered with the whole inventory at the current seq
+    channel.on_message(channel.widget, {'op': 'sync'}, [])
+    assert sent[-1] == {'seq': 3, 'op': 'reset', 'items': [InventoryChannel.slot_data(items[1])], 'max_items': 10}
+    game.add_item(items[2])
+    channel.on_message(channel.widget, {'op': 'move', 'from': 1, 'to': 0}, [])
+    assert game.items == [items[2], items[1]]
+    assert sent[-1] == {'seq': 5, 'op': 'move', 'from': 1, 'to': 0}
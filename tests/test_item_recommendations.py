@@ -0,0 +1,54 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from knn_rpg_core import RPGInventory
+
+
+def test_batch_matches_per_item_similarity():
+    game = RPGInventory(seed=2)
+    game.generate_simulated_items(300)
+    game.generate_simulated_players(200)
+    recommender = game.recommender
+    items = game.item_catalog.items
+    characters = game.characters[:40]
+    # A tiny block budget forces one character per chunk
+    for max_block_values in (2 ** 22, 1):
+        item_ids, scores = recommender.recommend_items_batch(characters, 7, max_block_values=max_block_values)
+        for character, row_ids, row_scores in zip(characters, item_ids.tolist(), scores.tolist()):
+            expected = sorted(
+                range(len(items)), key=lambda i: -recommender.calculate_item_similarity(character, items[i])
+            )[:7]
+            assert row_ids == expected
+            assert row_scores == [recommender.calculate_item_similarity(character, items[i]) for i in expected]
+
+
+@pytest.mark.parametrize('weighting', ['uniform', 'distance'])
+def test_collaborative_items_match_counter_loop(weighting):
+    game = RPGInventory(seed=4)
+    game.generate_simulated_items(60)
+    game.generate_simulated_players(400)
+    recommender = game.recommender
+    store = game.character_store
+    k, n_neighbors = 6, 8
+    item_ids, scores = recommender.collaborative_items_batch(None, k, n_neighbors, weighting)
+    for row in range(0, len(store), 7):
+        distances, indices = recommender.get_recommendations_batch(
+            recommender.feature_matrix([row]), n_neighbors, exclude_rows=[row]
+        )
+        counts = Counter()
+        for distance, neighbor in zip(distances[0], indices[0]):
+            weight = 1 if weighting == 'uniform' else 1 / (distance + 1e-9)
+            for item_id in store.inventory_ids(neighbor).tolist():
+                counts[item_id] += weight
+        for item_id in store.inventory_ids(row).tolist():
+            counts.pop(item_id, None)
+        expected = sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))[:k]
+        found = item_ids[row] >= 0
+        assert found.sum() == len(expected)
+        np.testing.assert_allclose(scores[row][found], [score for _, score in expected], rtol=1e-5)
+        if weighting == 'uniform':
+            assert item_ids[row][found].tolist() == [item_id for item_id, _ in expected]
+        else:
+            assert set(item_ids[row][found].tolist()) == {item_id for item_id, _ in expected}
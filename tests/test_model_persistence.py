@@ -0,0 +1,53 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import knn_rpg_core
+from knn_rpg_core import RPGInventory
+
+
+def make_game():
+    game = RPGInventory(seed=8)
+    game.generate_simulated_players(500)
+    return game
+
+
+def test_save_and_load_round_trip(tmp_path):
+    directory = str(tmp_path / 'model')
+    game = make_game()
+    game.recommender.fit()
+    game.recommender.save_model(directory)
+    other = make_game()
+    assert other.recommender.load_model(directory)
+    queries = game.recommender.feature_matrix(np.arange(50))
+    for expected, found in zip(game.recommender.get_recommendations_batch(queries, 5),
+                               other.recommender.get_recommendations_batch(queries, 5)):
+        assert np.array_equal(expected, found)
+
+
+def test_crash_during_save_leaves_no_mismatched_model(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'model')
+    game = make_game()
+    game.recommender.fit()
+    game.recommender.save_model(directory)
+
+    # The store changes and warm_start-style code refits and saves over the same directory, but
+    # the process dies while the new index is being written
+    game.characters[0].strength = 1 if game.characters[0].strength != 1 else 2
+    game.recommender.fit()
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(knn_rpg_core.pickle, 'dump', crash)
+    with pytest.raises(KeyboardInterrupt):
+        game.recommender.save_model(directory)
+    monkeypatch.undo()
+
+    # A store matching the first save must not accept whatever is left in the directory
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not make_game().recommender.load_model(directory)
+    game.recommender.save_model(directory)
+    assert game.recommender.load_model(directory)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from knn_rpg_core import Character, CharacterStore, RPGInventory
+
+
+def assert_matches_recompute(game):
+    # Every running aggregate against pandas groupby / bincount over the current store
+    stats = game.population_stats
+    store = game.character_store
+    df = store.to_frame()
+    df['inventory_size'] = store.column('inventory_count')
+    codes = store.column('class_code').astype(np.intp)
+    n_classes = len(stats.counts)
+    assert np.array_equal(stats.counts, np.bincount(codes, minlength=n_classes))
+
+    stat_names = ['strength', 'intelligence', 'dexterity']
+    groups = df.groupby('class')[stat_names]
+    expected_means = groups.mean().sort_index()
+    expected_std = groups.std(ddof=0).sort_index()
+    np.testing.assert_allclose(stats.class_means().sort_index().to_numpy(), expected_means.to_numpy())
+    np.testing.assert_allclose(stats.class_std().sort_index().to_numpy(), expected_std.to_numpy(), atol=1e-9)
+
+    bins = stats.stat_bins
+    for stat in CharacterStore.STAT_COLUMNS:
+        values = np.clip(store.column(stat).astype(np.int64), 0, bins - 1)
+        assert np.array_equal(stats.stat_histogram(stat), np.bincount(values, minlength=bins))
+        for code, char_class in enumerate(store.class_names):
+            assert np.array_equal(
+                stats.stat_histogram(stat, char_class), np.bincount(values[codes == code], minlength=bins)
+            )
+    strength = np.clip(df['strength'].to_numpy(), 0, bins - 1)
+    intelligence = np.clip(df['intelligence'].to_numpy(), 0, bins - 1)
+    joint = np.zeros((bins, bins), dtype=np.int64)
+    np.add.at(joint, (strength, intelligence), 1)
+    assert np.array_equal(stats.joint_histogram.sum(axis=0), joint)
+    sizes = np.clip(df['inventory_size'].to_numpy(), 0, stats.inventory_bins - 1)
+    assert np.array_equal(stats.inventory_size_histogram(), np.bincount(sizes, minlength=stats.inventory_bins))
+
+
+@pytest.mark.parametrize('file_format', ['json', 'columnar'])
+def test_aggregates_follow_edits_and_reloads(tmp_path, file_format):
+    rng = np.random.default_rng(5)
+    game = RPGInventory(seed=5)
+    game.generate_simulated_items(40)
+    game.generate_simulated_players(800)
+    items = game.item_catalog.items
+    assert_matches_recompute(game)
+
+    for step in range(400):
+        store = game.character_store
+        action = step % 5
+        if action == 0:
+            character = Character(f'New{step}', ['Warrior', 'Mage', 'Bard'][step % 3], int(rng.integers(1, 51)))
+            game.add_character(character)
+        elif action == 1:
+            character = game.characters[int(rng.integers(0, len(store)))]
+            setattr(character, ['strength', 'intelligence', 'dexterity', 'level'][step % 4], int(rng.integers(1, 21)))
+        elif action == 2:
+            game.characters[int(rng.integers(0, len(store)))].char_class = ['Rogue', 'Bard'][step % 2]
+        elif action == 3:
+            game.characters[int(rng.integers(0, len(store)))].inventory = list(rng.choice(items, int(rng.integers(0, 6))))
+        else:
+            store.remove(int(rng.integers(0, len(store))))
+    assert_matches_recompute(game)
+
+    path = str(tmp_path / 'state')
+    game.save_game_state(path, file_format=file_format)
+    reloaded = RPGInventory(seed=5)
+    reloaded.load_game_state(path)
+    assert_matches_recompute(reloaded)
+    game.load_game_state(path)
+    assert_matches_recompute(game)
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from knn_rpg_core import RPGInventory
+from knn_rpg_precompute import OUTPUT_COLUMNS, load_results, prepare_output, run_precompute
+
+
+def test_resume_after_kill_matches_direct_queries(tmp_path):
+    directory = str(tmp_path / 'precomputed')
+    game = RPGInventory(seed=6)
+    game.generate_simulated_items(50)
+    game.generate_simulated_players(1000)
+    recommender = game.recommender
+    recommender.fit()
+    prepare_output(directory, game, k=4, n_items=3, chunk_size=150, compact=False)
+    assert run_precompute(directory, workers=2) == 1000
+
+    # A kill leaves some chunks unrecorded, a checkpoint line cut short, and rows of the lost
+    # chunks that may or may not have reached the disk
+    with open(os.path.join(directory, 'checkpoint.txt'), 'w') as f:
+        f.write('0\n2\n3\n4\n5')
+    for column, (_, _, fill) in OUTPUT_COLUMNS.items():
+        values = np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r+')
+        values[150:300] = fill
+        values[800:] = fill
+        values.flush()
+        del values
+    with pytest.raises(ValueError):
+        load_results(directory)
+    assert len(load_results(directory, allow_partial=True)['neighbor_rows']) == 1000
+
+    # Chunks 1, 5 and 6 (rows 150-300 and 750-1000) are computed again
+    assert run_precompute(directory, workers=2) == 400
+    assert run_precompute(directory, workers=2) == 0
+    results = load_results(directory)
+    rows = np.arange(1000)
+    distances, indices = recommender.get_recommendations_batch(recommender.feature_matrix(rows), 4, exclude_rows=rows)
+    item_ids, scores = recommender.recommend_items_batch(recommender.feature_matrix(rows), 3)
+    assert np.array_equal(results['neighbor_rows'], indices)
+    np.testing.assert_allclose(results['neighbor_distances'], distances, rtol=1e-6)
+    assert np.array_equal(results['item_ids'], item_ids)
+    assert np.array_equal(results['item_scores'], scores)
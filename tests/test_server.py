@@ -0,0 +1,31 @@
+import asyncio
+import json
+
+import knn_rpg_server
+from knn_rpg_core import RPGInventory
+from knn_rpg_server import RecommendationServer
+
+
+def test_stats_keep_a_bounded_window(monkeypatch):
+    monkeypatch.setattr(knn_rpg_server, 'STATS_WINDOW', 8)
+    game = RPGInventory(seed=1)
+    game.generate_simulated_players(500)
+    server = RecommendationServer(game, max_batch=4, max_wait=0.001)
+
+    async def run():
+        for batcher in server.batchers.values():
+            batcher.start()
+        body = json.dumps({'row': 3, 'k': 3}).encode()
+        for _ in range(5):
+            responses = await asyncio.gather(*[server.handle_request('POST', '/neighbors', body) for _ in range(10)])
+            assert all(status == 200 for status, _ in responses)
+        for batcher in server.batchers.values():
+            batcher.task.cancel()
+        return server.stats()
+
+    stats = asyncio.run(run())
+    assert stats['requests'] == 50
+    assert len(server.latencies) == 8
+    batcher = server.batchers['/neighbors']
+    assert batcher.n_batches >= 13 and len(batcher.batch_sizes) == 8
+    assert stats['batches']['/neighbors']['count'] == batcher.n_batches